@@ -0,0 +1,215 @@
+"""
+Benchmarks of the pyPERSA stages on synthetic facet and tap files.
+
+Times and memory-profiles read_facet, process_facet, readtaps, load_fields and the
+end-to-end conversion over a range of sizes, and reports throughput in nodes or
+points*steps per second and MB/s of input. Timings are compared against a stored
+baseline and any stage slower than the baseline by more than the threshold is
+flagged as a regression, with a non-zero exit status.
+
+Files are generated once per size in the work directory and read back warm from the
+page cache, so the timings measure parsing and computation rather than the disk.
+
+Usage:
+    python benchmarks/run_benchmarks.py                    # compare with baselines.json
+    python benchmarks/run_benchmarks.py --save-baseline    # record a new baseline
+    python benchmarks/run_benchmarks.py --preset full      # 1e3 to 1e7 node facets
+
+Baselines are only meaningful on the machine they were recorded on.
+"""
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from pyPERSA import read_taps as tp
+from pyPERSA.facet_reader import read_facet, process_facet
+from pyPERSA.convert import convert_surface, loading_fields
+
+import synthetic
+
+# (cell types, node counts) of the facet benchmarks and (timesteps, points) of the tap benchmarks
+presets = {
+    "quick":   {"facets": (("quad", "tri", "mixed"), (1e3, 1e4)),
+                "taps":   ((64, 1e3), (64, 1e4))},
+    "default": {"facets": (("quad", "tri", "mixed"), (1e3, 1e4, 1e5, 1e6)),
+                "taps":   ((1024, 1e3), (256, 1e4), (256, 1e5), (32, 1e6))},
+    "full":    {"facets": (("quad", "tri", "mixed"), (1e3, 1e4, 1e5, 1e6, 1e7)),
+                "taps":   ((4096, 1e3), (1024, 1e4), (512, 1e5), (128, 1e6))},
+}
+
+# reference values consistent with the synthetic flow
+refs = {'gamma': 1.4, 'rgas': 1/1.4, 'rinf': 1.0, 'pinf': 1/1.4, 'tinf': 1.0, 'ainf': 1.0, 'refMach': 0.2}
+
+default_baseline = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+
+def measure(func, repeat):
+    """
+    Runs `func` once under tracemalloc for its peak allocation, then `repeat` times
+    untraced for its best wall-clock time. Output printed by `func` is discarded.
+
+    Returns
+    -------
+    seconds : float
+        Best time of the untraced runs.
+    peak : int
+        Peak bytes allocated by the traced run, including numpy arrays.
+    """
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        seconds = np.inf
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            seconds = min(seconds, time.perf_counter() - start)
+    return seconds, peak
+
+def result(name, seconds, peak, work, unit, nbytes):
+    return {"name": name, "seconds": seconds, "peak_mb": peak/2**20,
+            "throughput": work/seconds, "unit": unit, "mb_per_s": nbytes/2**20/seconds}
+
+def facet_benchmarks(workdir, cell_types, sizes, repeat):
+    """Times `read_facet` and `process_facet` on synthetic facets of every cell type and size."""
+    results = []
+    for cells in cell_types:
+        for size in sizes:
+            facetfile = os.path.join(workdir, f"{cells}_{int(size)}.facet")
+            if not os.path.isfile(facetfile):
+                synthetic.write_facet(facetfile, int(size), cells)
+            nbytes = os.path.getsize(facetfile)
+            nx, ny = synthetic.grid_shape(int(size))
+            nnodes = nx*ny
+            for stage, func in (("read_facet", lambda: read_facet(facetfile)),
+                                ("process_facet", lambda: process_facet(facetfile))):
+                seconds, peak = measure(func, repeat)
+                results.append(result(f"{stage}/{cells}/{int(size)}", seconds, peak, nnodes, "nodes/s", nbytes))
+    return results
+
+def tap_benchmarks(workdir, sizes, repeat):
+    """Times reading, field derivation and end-to-end conversion of synthetic tap files."""
+    results = []
+    has_pywopwop = importlib.util.find_spec("pywopwop") is not None
+    if not has_pywopwop:
+        print("pywopwop is not installed, skipping the conversion benchmarks")
+    for nt, size in sizes:
+        # the facet provides the surface of the end-to-end conversion, so the
+        # tap file has one point per facet node
+        facetfile = os.path.join(workdir, f"taps_{int(size)}.facet")
+        if not os.path.isfile(facetfile):
+            synthetic.write_facet(facetfile, int(size))
+        nx, ny = synthetic.grid_shape(int(size))
+        npts = nx*ny
+        taps_file = os.path.join(workdir, f"tap_{nt}_{npts}.bin")
+        if not os.path.isfile(taps_file):
+            synthetic.write_taps(taps_file, nt, npts)
+        nbytes = os.path.getsize(taps_file)
+        work = nt*npts
+        tag = f"{nt}x{npts}"
+
+        def read():
+            t, x, q = tp.readtaps(taps_file)
+            # readtaps returns views of the memory map, copying reads every record
+            np.array(q)
+
+        def load():
+            with tp.TapFile(taps_file, fields=loading_fields, ref=refs, stationary=True) as taps:
+                taps.load_fields()
+
+        stages = [("readtaps", read), ("load_fields", load)]
+        if has_pywopwop:
+            output_dir = os.path.join(workdir, "wopwop_input_files")
+            for pipelined in (False, True):
+                stages.append(("convert_pipelined" if pipelined else "convert",
+                               lambda pipelined=pipelined: convert_surface(
+                                   "bench", facetfile, taps_file, output_dir=output_dir, ref=refs,
+                                   itstart=0, pipelined=pipelined)))
+        for stage, func in stages:
+            seconds, peak = measure(func, repeat)
+            results.append(result(f"{stage}/{tag}", seconds, peak, work, "points*steps/s", nbytes))
+    return results
+
+def compare(results, baseline, threshold):
+    """
+    Flags the results slower than their baseline time by more than `threshold`.
+
+    Returns
+    -------
+    list of str
+        Names of the regressed benchmarks.
+    """
+    regressions = []
+    for r in results:
+        base = baseline.get(r["name"])
+        r["baseline_ratio"] = None if base is None else r["seconds"]/base
+        if base is not None and r["seconds"] > (1 + threshold)*base:
+            regressions.append(r["name"])
+    return regressions
+
+def print_table(results, regressions):
+    print(f"{'benchmark':<36}{'seconds':>10}{'peak MB':>10}{'throughput':>28}{'MB/s':>10}{'vs base':>9}")
+    for r in results:
+        ratio = "" if r["baseline_ratio"] is None else f"{r['baseline_ratio']:.2f}x"
+        flag = "  REGRESSION" if r["name"] in regressions else ""
+        print(f"{r['name']:<36}{r['seconds']:>10.4f}{r['peak_mb']:>10.1f}"
+              f"{r['throughput']:>12.3g} {r['unit']:<15}{r['mb_per_s']:>10.1f}{ratio:>9}{flag}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--preset", choices=sorted(presets), default="default",
+                        help="sizes to run (default: %(default)s)")
+    parser.add_argument("--only", choices=("facets", "taps"), help="run only one group of benchmarks")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per benchmark, the best is kept")
+    parser.add_argument("--workdir", help="directory of the generated files, kept between runs "
+                                          "(default: a temporary directory)")
+    parser.add_argument("--baseline", default=default_baseline, help="baseline file (default: %(default)s)")
+    parser.add_argument("--save-baseline", action="store_true", help="store these timings as the baseline")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="relative slowdown flagged as a regression (default: %(default)s)")
+    parser.add_argument("--report", help="write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    preset = presets[args.preset]
+    with contextlib.ExitStack() as stack:
+        workdir = args.workdir or stack.enter_context(tempfile.TemporaryDirectory(prefix="pypersa_bench_"))
+        os.makedirs(workdir, exist_ok=True)
+        results = []
+        if args.only in (None, "facets"):
+            results += facet_benchmarks(workdir, *preset["facets"], args.repeat)
+        if args.only in (None, "taps"):
+            results += tap_benchmarks(workdir, preset["taps"], args.repeat)
+
+    baseline = {}
+    if os.path.isfile(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = [] if args.save_baseline else compare(results, baseline, args.threshold)
+    if args.save_baseline:
+        for r in results:
+            r["baseline_ratio"] = None
+    print_table(results, regressions)
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump({"preset": args.preset, "results": results, "regressions": regressions}, f, indent=1)
+    if args.save_baseline:
+        baseline.update({r["name"]: r["seconds"] for r in results})
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=1, sort_keys=True)
+        print(f"saved {len(results)} timings to {args.baseline}")
+    if regressions:
+        print(f"{len(regressions)} benchmarks are more than {args.threshold:.0%} slower than the baseline")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
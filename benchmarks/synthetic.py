@@ -0,0 +1,126 @@
+"""
+Generators of synthetic facet files and Helios tap files for the benchmarks.
+
+Facet files are structured grids of quadrilaterals, triangles or a mix of both,
+written in the layout `read_facet` parses. Tap files are written record by record
+with `read_taps.tap_dtype`, so they have exactly the layout `tapinfo` and `TapFile`
+expect, and hold a smooth, physically valid flow so every derived field is finite.
+"""
+import numpy as np
+
+from pyPERSA.read_taps import tap_dtype
+
+def grid_shape(nnodes):
+    """Returns (nx, ny) of a near-square grid with about `nnodes` nodes."""
+    nx = max(int(np.sqrt(nnodes)), 2)
+    ny = max(int(round(nnodes/nx)), 2)
+    return nx, ny
+
+def grid_nodes(nx, ny):
+    """Returns the (nx*ny, 3) nodes of a wavy surface spanning the unit square."""
+    x, y = np.meshgrid(np.linspace(0, 1, nx), np.linspace(0, 1, ny), indexing='ij')
+    z = 0.05*np.sin(2*np.pi*x)*np.cos(2*np.pi*y)
+    return np.column_stack((x.ravel(), y.ravel(), z.ravel()))
+
+def grid_cells(nx, ny, cells='quad'):
+    """
+    Returns the 1-based (tri, quad) connectivity of an nx by ny grid. Either may be None.
+
+    Parameters
+    ----------
+    cells : {'quad', 'tri', 'mixed'}
+        'mixed' splits every other row of quadrilaterals into two triangles.
+    """
+    if cells not in ('quad', 'tri', 'mixed'):
+        raise ValueError(f"unknown cell type {cells}")
+    i, j = np.meshgrid(np.arange(nx - 1), np.arange(ny - 1), indexing='ij')
+    node = lambda i, j: i*ny + j + 1
+    quads = np.stack((node(i, j), node(i+1, j), node(i+1, j+1), node(i, j+1)), axis=-1)
+    if cells == 'quad':
+        return None, quads.reshape(-1, 4)
+    split = np.ones(i.shape, dtype=bool) if cells == 'tri' else (i % 2 == 1)
+    q = quads[split]
+    tris = np.concatenate((q[:, [0, 1, 2]], q[:, [0, 2, 3]]))
+    return tris, (quads[~split] if (~split).any() else None)
+
+def write_facet(facetfile, nnodes, cells='quad'):
+    """
+    Writes a synthetic facet file.
+
+    Parameters
+    ----------
+    facetfile : str
+        Path of the file to write.
+    nnodes : int
+        Approximate number of nodes.
+    cells : {'quad', 'tri', 'mixed'}, optional
+        Cell types, see `grid_cells`. Defaults to 'quad'.
+
+    Returns
+    -------
+    int
+        Number of nodes written.
+    """
+    nx, ny = grid_shape(nnodes)
+    nodes = grid_nodes(nx, ny)
+    blocks = [(name, c) for name, c in zip(("Triangles", "Quadrilaterals"), grid_cells(nx, ny, cells))
+              if c is not None]
+    with open(facetfile, 'w') as f:
+        f.write("FACET FILE V3.0\n1\nGrid\n0, 0.00 0.00 0.00 0.00\n")
+        f.write(f"{nodes.shape[0]}\n")
+        np.savetxt(f, nodes, fmt="%.8f")
+        f.write(f"{len(blocks)}\n")
+        for name, c in blocks:
+            f.write(f"{name}\n{c.shape[0]} {c.shape[1]}\n")
+            # part and boundary condition columns follow the node indices
+            np.savetxt(f, np.column_stack((c, np.zeros(c.shape[0], dtype=int), np.ones(c.shape[0], dtype=int))),
+                       fmt="%d")
+    return nodes.shape[0]
+
+def write_taps(taps_file, nt, npts, nq=5, dt=1e-4, chunk_size=64, gamma=1.4, seed=0):
+    """
+    Writes a synthetic Helios tap file of an acoustic wave over random points.
+
+    Parameters
+    ----------
+    taps_file : str
+        Path of the file to write.
+    nt : int
+        Number of timesteps.
+    npts : int
+        Number of tap points.
+    nq : int, optional
+        Number of conserved variables. Defaults to 5.
+    dt : float, optional
+        Time step. Defaults to 1e-4.
+    chunk_size : int, optional
+        Records generated at once. Defaults to 64.
+    gamma : float, optional
+        Ratio of specific heats used for the energy. Defaults to 1.4.
+    seed : int, optional
+        Seed of the point coordinates.
+
+    Returns
+    -------
+    int
+        Size of the file in bytes.
+    """
+    rng = np.random.default_rng(seed)
+    xyz = rng.random((npts, 3))
+    phase = 2*np.pi*xyz[:, 0]
+    dtype = tap_dtype(npts, nq)
+    with open(taps_file, 'wb') as f:
+        for it0 in range(0, nt, chunk_size):
+            t = (it0 + np.arange(min(chunk_size, nt - it0)))*dt
+            wave = 0.01*np.sin(2*np.pi*100*t[:, None] - phase)
+            records = np.zeros(t.shape[0], dtype=dtype)
+            records['nq'], records['npts'], records['time'] = nq, npts, t
+            records['xyz'] = xyz
+            rho = 1 + wave
+            u = 0.2 + wave
+            p = 1/gamma + wave
+            records['q'][..., 0] = rho
+            records['q'][..., 1] = rho*u
+            records['q'][..., 4] = p/(gamma - 1) + 0.5*rho*u**2
+            records.tofile(f)
+    return nt*dtype.itemsize
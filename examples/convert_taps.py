@@ -7,22 +7,25 @@ created from. Run this code inside the main helios directory. It will create a d
 "wopwop_input_files" with subdirectories for each extract name, where the geometry and 
 loading wopwop input files will be written.
 
-This code uses the pyPERSA module to read facet and tap files, and pywopwop to write in 
-PSU-WOPWOP input format. High-level processes are exposed and can be modified for your 
-application.
+This code uses the pyPERSA module to read facet and tap files and stream them to 
+PSU-WOPWOP input format, using pywopwop for the geometry. Tap files are converted in 
+blocks of chunk_size timesteps, so memory use does not depend on the length of the run.
 
-Calling the module functions, python buffers the output by default. To monitor the print
+Calling the module functions, python buffers the output by default. To monitor the log
 outputs of the code more closely, run with the unbuffered flag as "python -u convert_taps.py"
 or set the environment variable PYTHONUNBUFFERED=1
 """
 
-import numpy as np
-import re
-from pyPERSA import process_facet
+from pyPERSA import convert_case # streams tap files to wopwop input format
 from pyPERSA import read_taps as tp # functions to read Helios extracts tap files
-import pywopwop as PWW # functions to write data to wopwop input format
+from pyPERSA.case_manifest import read_case_manifest
+import logging
 import os
 
+# show the progress messages of pyPERSA. To also log stage timings, use logging.DEBUG
+# and call pyPERSA.instrument.enable(), or set profile below
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
 ###############################################
 #%% Inputs
 ###############################################
@@ -31,16 +34,43 @@ import os
 helios_grid_to_meter = 0.0254
 
 # path to the .facet files that the tap files were created from. We need to 
-# read them again to calculate the output surface connectivity
+# read them again to calculate the output surface connectivity. None uses the paths
+# recorded in extracts/case_manifest.json by create_taps.py
 facet_folder = "../perm/perm_surface/facetfiles/"
 
-# read tap_extracts to determine with tap corresponds to which surface name
-with open("extracts/tap_extracts.py") as f:
-    # Extracts content of all open('extracts/*.txt')
-    tapnames = re.findall(r"open\('(extracts/.*?\.txt)'\)", f.read())
+# number of timesteps held in memory at once while converting
+chunk_size = 256
+
+# number of surfaces converted in parallel, None uses every CPU
+nprocs = None
+
+# read the next chunk and write the previous one in background threads while the
+# current chunk is converted. Uses about three times the memory of one chunk.
+pipelined = True
+
+# time the parse, normals, read, derive and write stages of every surface and write
+# them to wopwop_input_files/<name>/performance.json
+profile = False
+
+# set to True while Helios is still running to convert only the timesteps appended
+# to the tap files since the last run, extending the existing loading files
+incremental = False
+
+# optionally thin out the taps before writing, e.g. Decimator(4) keeps every 4th timestep
+# after an anti-aliasing filter, UniformResampler(dt) interpolates onto a uniform time step.
+# Cannot be combined with incremental.
+resampler = None
+# from pyPERSA.resample import Decimator, UniformResampler
+# resampler = Decimator(4)
+
+# extracts folders of earlier runs this Helios run was restarted from, e.g. ["../run1/extracts"].
+# Their tap files are read together with the ones in extracts/ as one time series, and
+# timesteps repeated after a restart are taken from the latest run.
+restart_extract_dirs = []
 
-# remove extracts folder prefix and file extension, get to list of [extractname0.txt...extractnameN.txt]
-tapnames = [tapname.split("/")[-1].split(".")[0] for tapname in tapnames] 
+# distance in meters within which tap points are matched to facet nodes by position.
+# None assumes tap point k is facet node k, as written by create_taps.py
+match_tol = None
 
 #####################################
 #%% Working Code
@@ -49,67 +79,21 @@ tapnames = [tapname.split("/")[-1].split(".")[0] for tapname in tapnames]
 # write the input files to their own directories which we can run wopwop from
 os.makedirs("wopwop_input_files",exist_ok=True)
 
-for i, name in enumerate(tapnames):
-
-    # define paths
-    facetfile = facet_folder + name + ".facet"
-    tapfile = "extracts/tap_" + f"{i:02}.bin"
-    geometry_output_file="wopwop_input_files/" +name+ "/Geometry.dat"
-    loading_output_file="wopwop_input_files/" +name+ "/Loading.dat"
-    
-    os.makedirs("wopwop_input_files/"+name,exist_ok=True)
-
-    # get surface connectivity from facet file
-    xyz, normals, tri_connectivity, quad_connectivity = process_facet(facetfile, conversion = helios_grid_to_meter)
-
-    # Settings for read_taps submodule
-    tp.stationary = True    	# this tells to save XYZ at first timestep only
-    tp.setrefs()            	# this requires inputs.py to be in same folder to get reference values
-    print("reading tap file " + tapfile)
-    tp.set_and_read(tapfile) 
-    tp.set_fields(["Density", "XMomentum", "YMomentum", "ZMomentum", "Pressure"])
-   
-    # Load tap data
-    v = tp.load_fields(itstart=1, ntime=-1)
-
-    v['Pressure'] = v['Pressure'] - tp.ref['pinf']  # subtract pinf from taps
-    v['T'] = v['T'] - v['T'][0]     # set first time value to 0 (optional but convenient for PSU-WOPWOP)
-    print(f"data is {v['T'][-1]} seconds long.")
-
-    # reshape field data v into (nt, 5, nPoints) array
-    loading_data = np.stack((v['Density'],v['XMomentum'],v['YMomentum'],\
-                              v['ZMomentum'],v['Pressure']), axis=1)
-
-    #################################
-    #%% initialize PWWPatch instance
-    #################################
-    myWopwopData = PWW.PWWPatch()
-
-    # add general header info
-    myWopwopData.is_structured = False
-    myWopwopData.centered_type = 'node'
-    myWopwopData.float_type = 'single'
-    myWopwopData.has_iblank = False
-    myWopwopData.set_units_string('Pa')
-
-    # add geometry info
-    myWopwopData.geometry_type = 'geometry'
-    myWopwopData.geometry_time_type = 'constant'
-    myWopwopData.set_geometry_comment('Unstructured file - patch')
-
-    # add loading info
-    myWopwopData.loading_time_type = 'aperiodic'
-    myWopwopData.loading_data_type = 'flow_params'	# flow_params is permeable
-    myWopwopData.loading_ref_frame = 'ground_fixed'
-    myWopwopData.set_loading_comment('Unstructured file - loading')
-
-    myWopwopData.add_UnstructuredZone(name, xyz, normals, \
-                quad_connectivity=quad_connectivity, \
-                loading_data=loading_data, time_steps=v['T'])
-
-    # this prints an overview of geometry/loading inputted, and what will be written.
-    myWopwopData.print_info(zones_info=True)    
-
-    # write to wopwop input format in the created tap name subdirectories
-    myWopwopData.write_geometry_file(geometry_output_file)
-    myWopwopData.write_loading_file(loading_output_file)
+# (name, facet file, tap file) for each surface, from the case manifest, or from
+# tap_extracts.py for extracts written before case manifests existed
+surfaces = read_case_manifest("extracts", facet_folder=facet_folder)
+if restart_extract_dirs:
+    surfaces = [(name, facetfile, [os.path.join(d, os.path.basename(tapfile)) for d in restart_extract_dirs] + [tapfile])
+                for name, facetfile, tapfile in surfaces]
+
+# Settings for read_taps submodule
+tp.setrefs()            	# this requires inputs.py to be in same folder to get reference values
+
+# convert the surfaces in parallel, largest first. Each tap file is streamed in blocks of
+# chunk_size timesteps, writing the geometry and appending each block to the aperiodic
+# loading file as it is converted. pinf is subtracted from the pressure and the first
+# time value is set to 0. A failing surface is reported without stopping the others.
+results = convert_case(surfaces, nprocs=nprocs, output_dir="wopwop_input_files",
+                       conversion=helios_grid_to_meter, ref=tp.ref, itstart=1,
+                       chunk_size=chunk_size, use_facet_cache=True, incremental=incremental,
+                       resampler=resampler, match_tol=match_tol, pipelined=pipelined, profile=profile)
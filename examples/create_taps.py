@@ -9,7 +9,8 @@ files, and see the bodyID or frameID generated.
 
 This code will generate an extracts folder, a tap file for each .facet file in 
 the target directory, and a tap_extracts.py setting up the extracts interface 
-for Helios. Move this "extracts" folder to the main the Helios run directory and
+for Helios, and a case_manifest.json recording the facet file and tap file of each
+surface. Move this "extracts" folder to the main the Helios run directory and
 it will automatically save data at these taps when run.
 
 This code uses the pyPERSA module to read facets and write them in format for the 
@@ -17,12 +18,19 @@ Helios extracts module
 """
 
 from pyPERSA import read_facet, write_extract_points, write_extracts_py
+from pyPERSA.case_manifest import write_case_manifest
+import logging
 import os
 
+# show the progress messages of pyPERSA. To also log stage timings, use logging.DEBUG
+# and call pyPERSA.instrument.enable()
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+
 facet_folder = 'facetfiles'
 reference="frameID=-2"
 frequency=6
 tap_write_dir= 'extracts'
+binary = True   # write .npy tap points, loaded by Helios much faster than text. False writes text
 
 facet_files = [f for f in os.listdir(facet_folder) if f.endswith('.facet')]
 print("converting facet files: ", facet_files)
@@ -31,16 +39,23 @@ os.makedirs(tap_write_dir, exist_ok=True)
 
 # read each file, write xyz coordinates as 3 column list, add its name to tapnames list
 tapnames = []
+names, facetfiles = [], []
 for facet_file in facet_files:
-    xyz, _, _ = read_facet(os.path.join(facet_folder, facet_file))
+    # use_cache stores the parsed facet next to it so convert_taps.py can skip parsing
+    xyz, _, _ = read_facet(os.path.join(facet_folder, facet_file), use_cache=True)
 
     # write the tap file
-    write_extract_points(xyz, tap_write_dir=tap_write_dir, tapname=facet_file.split('.')[0])
+    tapfilename = write_extract_points(xyz, tap_write_dir=tap_write_dir, tapname=facet_file.split('.')[0],
+                                       binary=binary)
 
     # add name to list for tap_extracts.py
-    tapnames.append(facet_file.replace('.facet','.txt'))
+    tapnames.append(tapfilename)
+    names.append(facet_file.split('.')[0])
+    facetfiles.append(os.path.join(facet_folder, facet_file))
 
 # write tap_extracts.py file to point to the tap files just written.
 write_extracts_py(tapnames, reference=reference, frequency=frequency)
 # move the generated file into the folder with the taps
-os.system("mv tap_extracts.py " + tap_write_dir)
+os.replace("tap_extracts.py", os.path.join(tap_write_dir, "tap_extracts.py"))
+# record which facet file and tap file belong to each surface, read by convert_taps.py
+write_case_manifest(tap_write_dir, names, facetfiles)
@@ -7,33 +7,33 @@ geometry and loading files for each permeable surface generated. Change the
 'namelist_file' variable below to the name of your namelist file e.g. 
 "wopwop.nam".
 
-Run this code in the 'wopwop_input_files' directory to copy the namelist file
-into each folder and create a 'cases.nam' pointing WOPWOP to the permeable 
+Run this code in the 'wopwop_input_files' directory to place the namelist file
+into each folder and create the 'cases.nam' files pointing WOPWOP to the permeable 
 surface folders. After running this code, the directories should be set up to
 run WOPWOP to obtain the far-field noise for each surface.
+
+With njobs = 1 a single 'cases.nam' lists every surface, as before. With more jobs,
+the surfaces are split into njobs groups of about equal cost (nodes times timesteps,
+read from each Loading.dat header), written to 'job_00/cases.nam' ... Run one WOPWOP
+job from each job_NN directory, e.g. as separate batch jobs. The jobs are listed in
+'launch_manifest.json'.
 """
-import os
+import logging
+from pyPERSA.distribute import distribute_cases
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
 
 ###########################
 # INPUT
 ###########################
 namelist_file="wopwop.nam"
 
-# get a list of all the folders in this directory, considering each one to 
-# contain permeable surface inputs
-case_folders = [ f.path for f in os.scandir(".") if f.is_dir() ]
-
-print("cases: ", case_folders)
-
+# number of WOPWOP jobs run in parallel
+njobs = 1
 
-# copy wopwop.nam to all folders
-for case_folder in case_folders:
-    os.system(f"cp {namelist_file} " + case_folder)
+# every folder in this directory is considered to contain permeable surface inputs.
+# The namelist is hard linked into each of them, or copied if linking is not possible
+manifest = distribute_cases(".", namelist_file=namelist_file, njobs=njobs)
 
-# write "cases.nam" file pointing WOPWOP to all of the case folders
-with open("cases.nam", "w") as f:
-    for case_folder in case_folders:
-        f.write("&caseName\n")
-        f.write("globalFolderName='"+case_folder+"/'\n")
-        f.write(f"caseNameFile='{namelist_file}'\n")
-        f.write("/\n")
+for job in manifest["jobs"]:
+    print(f"cd {job['directory']} && wopwop   # {len(job['surfaces'])} surfaces, cost {job['cost']}")
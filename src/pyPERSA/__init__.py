@@ -1,4 +1,35 @@
-from .facet_reader import process_facet, read_facet
-from .write_extracts import write_extract_points, write_extracts_py, rotate
+"""
+Submodules and their functions are imported on first use, so importing pyPERSA, or
+starting the `pypersa` command, does not load modules the caller never touches.
+"""
+import importlib
+
+# public name -> submodule defining it
+_exports = {
+    "process_facet": "facet_reader", "read_facet": "facet_reader",
+    "merge_facets": "facet_reader", "write_facet": "facet_reader",
+    "write_extract_points": "write_extracts", "write_extracts_py": "write_extracts", "rotate": "write_extracts",
+    "Transform": "transform", "compose": "transform", "transform_facets": "transform",
+    "convert_surface": "convert", "convert_split_surfaces": "convert",
+    "convert_surface_periodic": "convert", "convert_case": "convert",
+}
+
 # leaving read_taps as a submodule
-from . import read_taps
+_submodules = {"case_manifest", "cli", "convert", "distribute", "facet_reader", "instrument", "periodic",
+               "pipeline", "read_taps", "resample", "spatial_hash", "tap_index", "tap_series", "tap_store",
+               "transform", "write_extracts", "write_loading"}
+
+__all__ = list(_exports) + ["read_taps"]
+
+def __getattr__(name):
+    if name in _exports:
+        value = getattr(importlib.import_module(f".{_exports[name]}", __name__), name)
+    elif name in _submodules:
+        value = importlib.import_module(f".{name}", __name__)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_exports) | _submodules)
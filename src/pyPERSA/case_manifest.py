@@ -0,0 +1,93 @@
+"""
+The case manifest links every surface of a case to its facet file and tap file. It is
+written next to the tap points by `create-taps`, moves with the extracts folder into
+the Helios run directory, and is read by the conversion and distribution steps, so
+they never parse tap_extracts.py or search for facet files again.
+
+Layout of `extracts/case_manifest.json`::
+
+    {"surfaces": [{"name": "blade", "facetfile": "/abs/path/blade.facet",
+                   "tap_index": 0, "tapfile": "tap_00.bin"}, ...]}
+
+Tap files are relative to the manifest, since Helios writes them into the same folder.
+"""
+import json
+import os
+import re
+
+manifest_name = "case_manifest.json"
+
+def tap_file_name(tap_index):
+    """Returns the name of the file Helios writes the taps of the `tap_index`-th tap set to."""
+    return f"tap_{tap_index:02}.bin"
+
+def write_case_manifest(extracts_dir, names, facetfiles):
+    """
+    Writes the case manifest of the tap sets written to `extracts_dir`.
+
+    Parameters
+    ----------
+    extracts_dir : str
+        Folder holding the tap points and tap_extracts.py.
+    names : list of str
+        Surface names, in the order of the tap sets in tap_extracts.py.
+    facetfiles : list of str
+        Facet file of each surface. Stored as absolute paths.
+
+    Returns
+    -------
+    str
+        Path of the manifest.
+    """
+    manifest = {"surfaces": [{"name": name, "facetfile": os.path.abspath(facetfile),
+                              "tap_index": i, "tapfile": tap_file_name(i)}
+                             for i, (name, facetfile) in enumerate(zip(names, facetfiles))]}
+    path = os.path.join(extracts_dir, manifest_name)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(path + ".tmp", path)
+    return path
+
+def read_tap_extracts(tap_extracts_file):
+    """
+    Returns the surface names of the tap sets of a tap_extracts.py file, in order, from
+    the files its tap sets load, e.g. 'extracts/blade.npy' gives 'blade'. For cases
+    created before case manifests were written.
+    """
+    with open(tap_extracts_file) as f:
+        # every open('extracts/*.txt') or numpy.load('extracts/*.npy')
+        tapnames = re.findall(r"(?:open|load)\('(extracts/.*?\.(?:txt|npy))'\)", f.read())
+    return [tapname.split("/")[-1].split(".")[0] for tapname in tapnames]
+
+def read_case_manifest(extracts_dir="extracts", facet_folder=None):
+    """
+    Returns the surfaces of a case as (name, facetfile, tapfile) tuples, as taken by
+    `convert.convert_case`.
+
+    Reads the case manifest of `extracts_dir`, or falls back to parsing its
+    tap_extracts.py and looking up `facet_folder/name.facet` if there is none.
+
+    Parameters
+    ----------
+    extracts_dir : str, optional
+        Folder holding the tap files. Defaults to 'extracts'.
+    facet_folder : str, optional
+        Folder of the facet files. Replaces the folders stored in the manifest,
+        e.g. if the facet files were moved. Required without a manifest.
+    """
+    path = os.path.join(extracts_dir, manifest_name)
+    if os.path.isfile(path):
+        with open(path) as f:
+            entries = json.load(f)["surfaces"]
+        surfaces = []
+        for entry in entries:
+            facetfile = entry["facetfile"]
+            if facet_folder is not None:
+                facetfile = os.path.join(facet_folder, os.path.basename(facetfile))
+            surfaces.append((entry["name"], facetfile, os.path.join(extracts_dir, entry["tapfile"])))
+        return surfaces
+    if facet_folder is None:
+        raise FileNotFoundError(f"{path} does not exist, give the folder of the facet files")
+    names = read_tap_extracts(os.path.join(extracts_dir, "tap_extracts.py"))
+    return [(name, os.path.join(facet_folder, name + ".facet"), os.path.join(extracts_dir, tap_file_name(i)))
+            for i, name in enumerate(names)]
@@ -0,0 +1,143 @@
+"""
+The `pypersa` command line interface, with one subcommand per step of the workflow:
+
+    pypersa create-taps   facet files -> extracts folder for Helios, with a case manifest
+    pypersa convert       tap files written by Helios -> PSU-WOPWOP geometry and loading files
+    pypersa distribute    namelist and cases.nam files for one or several WOPWOP jobs
+
+Modules are imported inside the subcommands, so starting the command only loads the
+modules the subcommand needs.
+"""
+import argparse
+import logging
+import os
+import sys
+
+def create_taps(args):
+    """Writes the tap points of every facet file, tap_extracts.py and the case manifest."""
+    from .facet_reader import read_facet
+    from .write_extracts import write_extract_points, write_extracts_py
+    from .case_manifest import write_case_manifest
+
+    facet_files = sorted(f for f in os.listdir(args.facet_folder) if f.endswith('.facet'))
+    if not facet_files:
+        raise FileNotFoundError(f"no .facet files in {args.facet_folder}")
+    os.makedirs(args.tap_write_dir, exist_ok=True)
+
+    names, facetfiles, tapnames = [], [], []
+    for facet_file in facet_files:
+        facetfile = os.path.join(args.facet_folder, facet_file)
+        # the cache lets the conversion skip parsing the facet file again
+        xyz, _, _ = read_facet(facetfile, use_cache=True)
+        name = facet_file.split('.')[0]
+        tapnames.append(write_extract_points(xyz, tap_write_dir=args.tap_write_dir, tapname=name,
+                                             binary=not args.text))
+        names.append(name)
+        facetfiles.append(facetfile)
+
+    write_extracts_py(tapnames, reference=args.reference, frequency=args.frequency)
+    os.replace("tap_extracts.py", os.path.join(args.tap_write_dir, "tap_extracts.py"))
+    write_case_manifest(args.tap_write_dir, names, facetfiles)
+    return 0
+
+def convert(args):
+    """Converts the tap files of every surface of the case manifest."""
+    from .case_manifest import read_case_manifest
+    from .convert import convert_case
+
+    surfaces = read_case_manifest(args.extracts_dir, facet_folder=args.facet_folder)
+    if args.surfaces:
+        surfaces = [s for s in surfaces if s[0] in args.surfaces]
+    if args.restart_extract_dirs:
+        surfaces = [(name, facetfile, [os.path.join(d, os.path.basename(tapfile)) for d in args.restart_extract_dirs]
+                     + [tapfile]) for name, facetfile, tapfile in surfaces]
+
+    resampler = None
+    if args.decimate:
+        from .resample import Decimator
+        resampler = Decimator(args.decimate)
+    elif args.resample_dt:
+        from .resample import UniformResampler
+        resampler = UniformResampler(args.resample_dt)
+
+    # the reference values are read from inputs.py of the Helios run directory
+    if os.getcwd() not in sys.path:
+        sys.path.insert(0, os.getcwd())
+    os.makedirs(args.output_dir, exist_ok=True)
+    results = convert_case(surfaces, nprocs=args.nprocs, output_dir=args.output_dir,
+                           conversion=args.conversion, itstart=args.itstart,
+                           chunk_size=args.chunk_size, use_facet_cache=True, incremental=args.incremental,
+                           resampler=resampler, match_tol=args.match_tol, pipelined=args.pipelined,
+                           profile=args.profile)
+    return 1 if any(result["error"] for result in results) else 0
+
+def distribute(args):
+    """Places the namelist in every surface folder and writes the cases.nam files."""
+    from .distribute import distribute_cases
+    from .case_manifest import manifest_name, read_case_manifest
+
+    tapfiles = None
+    if os.path.isfile(os.path.join(args.extracts_dir, manifest_name)):
+        # tap files give the cost of surfaces that are not converted yet
+        tapfiles = {name: tapfile for name, facetfile, tapfile in read_case_manifest(args.extracts_dir)}
+    manifest = distribute_cases(args.input_dir, namelist_file=args.namelist, njobs=args.njobs,
+                                link=not args.copy, tapfiles=tapfiles)
+    for job in manifest["jobs"]:
+        print(f"{job['cases_file']}: {len(job['surfaces'])} surfaces, cost {job['cost']}")
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="pypersa", description="Helios tap files to PSU-WOPWOP permeable surfaces")
+    parser.add_argument("-v", "--verbose", action="count", default=0,
+                        help="log progress, twice to also log the timing of every stage")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p = subparsers.add_parser("create-taps", help="write Helios extracts for the facet files of a folder")
+    p.add_argument("facet_folder", help="folder of the .facet files")
+    p.add_argument("--reference", default="frameID=1", help="Helios frame the taps are attached to (default: %(default)s)")
+    p.add_argument("--frequency", type=int, default=1, help="extract frequency in timesteps (default: %(default)s)")
+    p.add_argument("--tap-write-dir", default="extracts", help="output folder (default: %(default)s)")
+    p.add_argument("--text", action="store_true", help="write text tap points instead of .npy")
+    p.set_defaults(func=create_taps)
+
+    p = subparsers.add_parser("convert", help="convert tap files to PSU-WOPWOP input files, run in the Helios directory")
+    p.add_argument("--extracts-dir", default="extracts", help="folder of the tap files (default: %(default)s)")
+    p.add_argument("--facet-folder", help="folder of the facet files, overriding the case manifest")
+    p.add_argument("--output-dir", default="wopwop_input_files", help="output folder (default: %(default)s)")
+    p.add_argument("--conversion", type=float, default=1.0,
+                   help="multiplier from facet units to meters, e.g. 0.0254 (default: %(default)s)")
+    p.add_argument("--surfaces", nargs="+", help="convert only these surfaces")
+    p.add_argument("--itstart", type=int, default=1, help="first timestep (default: %(default)s)")
+    p.add_argument("--chunk-size", type=int, default=256, help="timesteps held in memory (default: %(default)s)")
+    p.add_argument("--nprocs", type=int, help="surfaces converted in parallel (default: every CPU)")
+    p.add_argument("--incremental", action="store_true", help="convert only timesteps added since the last run")
+    p.add_argument("--pipelined", action="store_true", help="overlap reading, deriving and writing")
+    p.add_argument("--profile", action="store_true", help="write performance.json for every surface")
+    p.add_argument("--match-tol", type=float, help="match tap points to facet nodes within this distance")
+    p.add_argument("--restart-extract-dirs", nargs="+", help="extracts folders of the runs this run restarted from")
+    group = p.add_mutually_exclusive_group()
+    group.add_argument("--decimate", type=int, help="keep one timestep out of this many, after filtering")
+    group.add_argument("--resample-dt", type=float, help="interpolate onto this uniform time step")
+    p.set_defaults(func=convert)
+
+    p = subparsers.add_parser("distribute", help="set up cases.nam files for one or several WOPWOP jobs")
+    p.add_argument("--input-dir", default="wopwop_input_files", help="folder of the surfaces (default: %(default)s)")
+    p.add_argument("--namelist", default="wopwop.nam", help="namelist in the input folder (default: %(default)s)")
+    p.add_argument("--njobs", type=int, default=1, help="number of parallel WOPWOP jobs (default: %(default)s)")
+    p.add_argument("--copy", action="store_true", help="copy the namelist instead of hard linking it")
+    p.add_argument("--extracts-dir", default="extracts",
+                   help="folder of the case manifest, to estimate unconverted surfaces (default: %(default)s)")
+    p.set_defaults(func=distribute)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    level = logging.WARNING if args.verbose == 0 else logging.INFO if args.verbose == 1 else logging.DEBUG
+    logging.basicConfig(level=level, format="%(message)s")
+    if args.verbose >= 2:
+        from . import instrument
+        instrument.enable()
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
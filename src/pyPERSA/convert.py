@@ -0,0 +1,657 @@
+"""
+Library-level conversion of Helios tap files to PSU-WOPWOP input files.
+Tap files are streamed in bounded blocks of timesteps so memory use depends on the
+chunk size rather than on the length of the run, and independent surfaces can be
+converted in parallel processes.
+"""
+import numpy as np
+import contextlib
+import copy
+import json
+import logging
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from .facet_reader import process_facet
+from . import read_taps as tp
+from .spatial_hash import match_points
+from .tap_series import TapSeries, open_taps
+from .pipeline import prefetch, WriteBehind
+from . import instrument
+from .instrument import span, surface_report
+from .periodic import estimate_period, extract_period, period_steps, periodicity_error
+from .write_loading import write_loading_header, update_loading_nt, append_loading_data, float_types
+
+logger = logging.getLogger(__name__)
+
+# flow_params loading order expected by PSU-WOPWOP for permeable surfaces
+loading_fields = ["Density", "XMomentum", "YMomentum", "ZMomentum", "PressurePerturbation"]
+
+# loading buffers of a pipelined conversion: one being derived, one waiting
+# in the writer queue and one being written
+_pipeline_buffers = 3
+
+def derive_loading(q, ref, out=None):
+    """
+    Derives the flow_params loading block from conserved variables.
+
+    Parameters
+    ----------
+    q : numpy.ndarray
+        A (nt, npts, nq) array of conserved variables.
+    ref : dict
+        Reference values, see `read_taps.read_refs`. 'pinf' is subtracted from the pressure.
+    out : numpy.ndarray, optional
+        Preallocated (nt, 5, npts) output array. Allocated as float32 if not given.
+
+    Returns
+    -------
+    numpy.ndarray
+        A (nt, 5, npts) array of density, x/y/z momentum and pressure perturbation.
+    """
+    if out is None:
+        out = np.empty((q.shape[0], len(loading_fields), q.shape[1]), dtype=np.float32)
+    with span("derive") as s:
+        # fields are computed in float64 and cast on assignment, so pinf is
+        # subtracted before any downcast and the perturbation keeps its precision
+        tp.compute_fields(q, loading_fields, ref, out={field: out[:,k,:] for k, field in enumerate(loading_fields)})
+        # pages of a memory-mapped q are read from disk here
+        s.add(bytes_read=q.size*q.itemsize if isinstance(q, np.memmap) else 0,
+              points=q.shape[0]*q.shape[1], array=out)
+    return out
+
+def _read_blocks(blocks, copy=False):
+    """
+    Yields the (t, q) blocks of `TapFile.iter_chunks`, timing each in a read span.
+
+    With `copy`, each block is copied out of the memory map, so the records are read
+    from disk here, e.g. in the reader thread of a pipelined conversion. Otherwise q
+    stays a view and its pages are read by the derive stage.
+    """
+    for t, q in blocks:
+        with span("read") as s:
+            if copy:
+                t, q = np.array(t), np.ascontiguousarray(q)
+                s.add(bytes_read=t.nbytes + q.nbytes, points=q.shape[0]*q.shape[1], array=q)
+        yield t, q
+
+def geometry_faces(quad_connectivity):
+    """
+    Returns the number of faces `write_geometry` writes, for the loading file header.
+    Only the quadrilaterals of a facet are written to the geometry file.
+    """
+    return 0 if quad_connectivity is None else quad_connectivity.shape[0]
+
+def write_geometry(name, xyz, normals, quad_connectivity, geometry_output_file):
+    """
+    Writes a constant unstructured PSU-WOPWOP geometry file with pywopwop. The loading
+    file of the zone must declare `geometry_faces(quad_connectivity)` faces.
+
+    Parameters
+    ----------
+    name : str
+        Zone name.
+    xyz : numpy.ndarray
+        A (npts, 3) array of node coordinates in meters.
+    normals : numpy.ndarray
+        A (npts, 3) array of node normals.
+    quad_connectivity : numpy.ndarray or None
+        A (n_quads, 4) connectivity array as returned by `read_facet`.
+    geometry_output_file : str
+        Path of the geometry file to write.
+    """
+    import pywopwop as PWW
+
+    myWopwopData = PWW.PWWPatch()
+    myWopwopData.is_structured = False
+    myWopwopData.centered_type = 'node'
+    myWopwopData.float_type = 'single'
+    myWopwopData.has_iblank = False
+    myWopwopData.set_units_string('Pa')
+
+    myWopwopData.geometry_type = 'geometry'
+    myWopwopData.geometry_time_type = 'constant'
+    myWopwopData.set_geometry_comment('Unstructured file - patch')
+
+    # pywopwop requires loading data with every zone, but only the geometry
+    # file is written here. The loading file is streamed separately.
+    myWopwopData.loading_time_type = 'aperiodic'
+    myWopwopData.loading_data_type = 'flow_params'
+    myWopwopData.loading_ref_frame = 'ground_fixed'
+    myWopwopData.add_UnstructuredZone(name, xyz, normals, \
+                quad_connectivity=quad_connectivity, \
+                loading_data=np.zeros((1, len(loading_fields), xyz.shape[0])), \
+                time_steps=np.zeros(1))
+
+    with span("write", geometry_output_file) as s:
+        myWopwopData.write_geometry_file(geometry_output_file)
+        s.add(bytes_written=os.path.getsize(geometry_output_file), points=xyz.shape[0])
+
+def match_taps_to_facet(taps, xyz, conversion, tol):
+    """
+    Matches the tap points of the first record to facet nodes with a spatial hash.
+
+    Parameters
+    ----------
+    taps : read_taps.TapFile or tap_series.TapSeries
+        The tap file.
+    xyz : numpy.ndarray
+        (npts, 3) facet node coordinates, already multiplied by `conversion`.
+    conversion : float
+        Multiplier converting tap coordinates to the units of `xyz`.
+    tol : float
+        Largest allowed distance between a facet node and its tap point.
+
+    Returns
+    -------
+    numpy.ndarray
+        (npts,) tap point of every facet node, so taking these points of the tap
+        file lines the loading data up with the facet nodes in a single gather.
+
+    Raises
+    ------
+    ValueError
+        If a facet node has no tap point within `tol`, or two nodes match the same point.
+    """
+    tap_xyz = np.asarray(taps.records(0, 1)['xyz'][0])*conversion
+    permutation, unmatched = match_points(xyz, tap_xyz, tol)
+    if unmatched.size:
+        raise ValueError(f"{unmatched.size} facet nodes have no tap point within {tol}, "
+                         f"e.g. nodes {unmatched[:10].tolist()}")
+    if np.unique(permutation).size != permutation.size:
+        raise ValueError(f"several facet nodes match the same tap point within {tol}")
+    if taps.npts > xyz.shape[0]:
+        logger.info("  %d tap points are not facet nodes and are skipped", taps.npts - xyz.shape[0])
+    return permutation
+
+def _read_checkpoint(checkpoint_file, loading_output_file, tapfile, npts, float_type):
+    """
+    Reads the checkpoint of an incremental conversion. Returns None if there is no
+    checkpoint or it does not match the loading file, so a full conversion is needed.
+    """
+    try:
+        with open(checkpoint_file) as f:
+            checkpoint = json.load(f)
+        loading_size = os.path.getsize(loading_output_file)
+    except (OSError, ValueError):
+        return None
+    if checkpoint.get("tapfile") != tapfile or checkpoint.get("npts") != npts or checkpoint.get("float_type") != float_type \
+            or checkpoint.get("loading_size", np.inf) > loading_size:
+        return None
+    return checkpoint
+
+def _checkpoint_matches(taps, checkpoint):
+    """
+    Checks that the last tap record converted before a checkpoint is still in the tap
+    file with the same time, so the file was appended to rather than rewritten by a new run.
+    """
+    if "last_time" not in checkpoint:
+        return True
+    last = checkpoint["next_record"] - 1
+    return 0 <= last < taps.nt and float(taps.records(last, 1)['time'][0]) == checkpoint["last_time"]
+
+def _write_checkpoint(checkpoint_file, checkpoint):
+    tmpfile = checkpoint_file + ".tmp"
+    with open(tmpfile, "w") as f:
+        json.dump(checkpoint, f, indent=1)
+    os.replace(tmpfile, checkpoint_file)
+
+def convert_surface(name, facetfile, tapfile, output_dir="wopwop_input_files", conversion=1,
+                    ref=None, itstart=1, ntime=-1, chunk_size=256, float_type='single',
+                    use_facet_cache=False, incremental=False, resampler=None, match_tol=None,
+                    pipelined=False, profile=False):
+    """
+    Converts one tap file and its facet file to PSU-WOPWOP geometry and aperiodic loading
+    files. The tap file is streamed in blocks of `chunk_size` timesteps, each block is
+    converted to loading data and appended to the loading file before the next is read.
+    With `pipelined`, the next blocks are read by a background thread and the previous
+    block is written by another while the current block is derived.
+
+    After every block a checkpoint (`Loading.dat.checkpoint.json`) records the next tap
+    record to convert, the time origin and the loading file header state. With
+    `incremental`, a matching checkpoint is resumed: only the records appended to the
+    tap file since the last call are converted, appended to the existing loading file,
+    and the timestep count in its header is updated in place.
+
+    Parameters
+    ----------
+    name : str
+        Surface name. Files are written to `output_dir/name/`.
+    facetfile : str
+        Path to the facet file the taps were created from.
+    tapfile : str or list of str
+        Path to the Helios tap file, e.g. 'extracts/tap_00.bin', or the tap files of
+        a restarted run, read as one `tap_series.TapSeries` that drops repeated times.
+    output_dir : str, optional
+        Root output directory. Defaults to 'wopwop_input_files'.
+    conversion : float, optional
+        Multiplier converting facet units to meters.
+    ref : dict, optional
+        Reference values. Read from inputs.py with `read_taps.read_refs` if not given.
+    itstart : int, optional
+        First timestep to convert. Defaults to 1. Ignored when resuming.
+    ntime : int, optional
+        Number of timesteps to convert in this call, -1 converts to the end of the file.
+    chunk_size : int, optional
+        Number of timesteps held in memory at once. Defaults to 256.
+    float_type : {'single', 'double'}, optional
+        Precision of the loading file. Defaults to 'single'. Fields are derived
+        in float64 and cast block by block, so only the chunk buffer is held at
+        this precision and nothing larger is ever materialized.
+    use_facet_cache : bool, optional
+        Reuse the binary sidecar cache of the facet file, see `read_facet`.
+    incremental : bool, optional
+        Resume from the checkpoint of a previous conversion if there is one.
+        Defaults to False.
+    resampler : object, optional
+        A `resample.UniformResampler` or `resample.Decimator` applied to each block
+        of loading data before it is written. Its state is not checkpointed, so it
+        cannot be combined with `incremental`.
+    match_tol : float, optional
+        Match tap points to facet nodes by position within this distance in meters,
+        see `match_taps_to_facet`, instead of assuming tap point k is facet node k.
+    pipelined : bool, optional
+        Overlap reading, deriving and writing in threads connected by bounded queues,
+        see `pipeline`. Holds about three times as many blocks in memory. The files
+        written are identical. Defaults to False.
+    profile : bool, optional
+        Time every stage and write a performance report to `output_dir/name/performance.json`,
+        see `instrument.surface_report`. Defaults to False.
+
+    Returns
+    -------
+    tuple of str
+        Paths of the geometry and loading files written.
+    """
+    if profile:
+        os.makedirs(os.path.join(output_dir, name), exist_ok=True)
+        with surface_report(name, os.path.join(output_dir, name, "performance.json")):
+            return convert_surface(name, facetfile, tapfile, output_dir=output_dir, conversion=conversion,
+                                   ref=ref, itstart=itstart, ntime=ntime, chunk_size=chunk_size,
+                                   float_type=float_type, use_facet_cache=use_facet_cache,
+                                   incremental=incremental, resampler=resampler, match_tol=match_tol,
+                                   pipelined=pipelined)
+    if incremental and resampler is not None:
+        raise ValueError("incremental conversion does not support resampling")
+    if ref is None:
+        ref = tp.read_refs()
+
+    surface_dir = os.path.join(output_dir, name)
+    os.makedirs(surface_dir, exist_ok=True)
+    geometry_output_file = os.path.join(surface_dir, "Geometry.dat")
+    loading_output_file  = os.path.join(surface_dir, "Loading.dat")
+    checkpoint_file      = loading_output_file + ".checkpoint.json"
+
+    # tap files are validated, dropping a truncated record still being written by Helios
+    taps = open_taps(tapfile, fields=loading_fields, ref=ref, stationary=True, precision=float_type)
+    if not isinstance(tapfile, str):
+        tapfile = list(tapfile)
+
+    xyz, normals, tri_connectivity, quad_connectivity = process_facet(facetfile, conversion=conversion,
+                                                                       use_cache=use_facet_cache)
+    npts = xyz.shape[0]
+    points = None
+    if match_tol is not None:
+        points = match_taps_to_facet(taps, xyz, conversion, match_tol)
+    elif npts != taps.npts:
+        raise ValueError(f"{facetfile} has {npts} nodes but {tapfile} has {taps.npts} points")
+
+    checkpoint = None
+    if incremental:
+        checkpoint = _read_checkpoint(checkpoint_file, loading_output_file, tapfile, npts, float_type)
+        if checkpoint is not None and not isinstance(taps, TapSeries) and not _checkpoint_matches(taps, checkpoint):
+            logger.warning("%s was rewritten since %s was converted, converting it again",
+                           tapfile, loading_output_file)
+            checkpoint = None
+
+    if checkpoint is None:
+        write_geometry(name, xyz, normals, quad_connectivity, geometry_output_file)
+        nfaces = geometry_faces(quad_connectivity)
+        with open(loading_output_file, 'wb') as f:
+            nt_offset = write_loading_header(f, name, 0, npts, nfaces, float_type=float_type)
+        checkpoint = {"tapfile": tapfile, "npts": npts, "float_type": float_type,
+                      "next_record": itstart, "t0": None, "nt": 0, "nt_offset": nt_offset,
+                      "loading_size": os.path.getsize(loading_output_file)}
+    else:
+        if isinstance(taps, TapSeries) and "last_time" in checkpoint:
+            # a restart may have replaced records, so resume after the last time written
+            checkpoint["next_record"] = int(np.searchsorted(taps.times, checkpoint["last_time"], side='right'))
+        logger.info("resuming %s at tap record %d", loading_output_file, checkpoint["next_record"])
+
+    ntime = taps.window(checkpoint["next_record"], ntime)[1]
+    logger.info("streaming %d timesteps of %s in chunks of %d", ntime, tapfile, chunk_size)
+
+    nbuffers = _pipeline_buffers if pipelined else 1
+    # blocks are never longer than the timesteps left to convert
+    buffers = np.empty((nbuffers, min(chunk_size, ntime), len(loading_fields), npts), dtype=float_types[float_type])
+    with taps, open(loading_output_file, 'r+b') as f:
+        # drop anything written after the last checkpoint by an interrupted run
+        f.truncate(checkpoint["loading_size"])
+        f.seek(checkpoint["loading_size"])
+
+        def write_block(t, loading_data, nrecords):
+            if t.shape[0] > 0:
+                if checkpoint["t0"] is None:
+                    checkpoint["t0"] = float(t[0])
+                append_loading_data(f, t - checkpoint["t0"], loading_data, float_type=float_type)
+                checkpoint["nt"] += t.shape[0]
+                checkpoint["end_time"] = float(t[-1] - checkpoint["t0"])
+                checkpoint["last_time"] = float(t[-1])
+            checkpoint["next_record"] += nrecords
+            update_loading_nt(f, checkpoint["nt_offset"], checkpoint["nt"])
+            f.flush()
+            checkpoint["loading_size"] = f.tell()
+            _write_checkpoint(checkpoint_file, checkpoint)
+
+        blocks = _read_blocks(taps.iter_chunks(chunk_size=chunk_size, itstart=checkpoint["next_record"],
+                                              ntime=ntime, points=points), copy=pipelined)
+        if pipelined:
+            blocks = prefetch(blocks)
+        writer = WriteBehind(write_block, depth=nbuffers - 2) if pipelined else contextlib.nullcontext()
+        with contextlib.closing(blocks), writer:
+            submit = writer.submit if pipelined else write_block
+            for i, (t, q) in enumerate(blocks):
+                loading_data = derive_loading(q, ref, out=buffers[i % nbuffers, :t.shape[0]])
+                nrecords = t.shape[0]
+                if resampler is not None:
+                    t, loading_data = resampler.process(t, loading_data)
+                submit(t, loading_data, nrecords)
+
+            if resampler is not None:
+                t, loading_data = resampler.flush()
+                if loading_data is not None:
+                    submit(t, loading_data, 0)
+
+    if checkpoint["nt"] > 0:
+        logger.info("data is %s seconds long", checkpoint["end_time"])
+    logger.info("wrote %s and %s", geometry_output_file, loading_output_file)
+    return geometry_output_file, loading_output_file
+
+def convert_split_surfaces(names, facetfiles, tapfile, output_dir="wopwop_input_files", conversion=1,
+                           ref=None, itstart=1, ntime=-1, chunk_size=256, float_type='single',
+                           use_facet_cache=False, pipelined=False):
+    """
+    Splits one combined tap file into several surfaces and converts them in a single
+    pass over the tap file. The tap points must be the nodes of the facet files in the
+    order given, as written by `write_extract_points` for the concatenated coordinates.
+
+    Parameters
+    ----------
+    names : list of str
+        Surface names. Files are written to `output_dir/name/`.
+    facetfiles : list of str
+        Facet file of each surface, in the order their nodes appear in the tap file.
+    tapfile : str or list of str
+        Path to the combined Helios tap file, or the combined tap files of a restarted run.
+    output_dir, conversion, ref, itstart, ntime, chunk_size, float_type, use_facet_cache, pipelined
+        See `convert_surface`.
+
+    Returns
+    -------
+    list of tuple
+        Paths of the geometry and loading files written for each surface.
+    """
+    if ref is None:
+        ref = tp.read_refs()
+
+    surfaces = []
+    offset = 0
+    for name, facetfile in zip(names, facetfiles):
+        xyz, normals, tri_connectivity, quad_connectivity = process_facet(facetfile, conversion=conversion,
+                                                                           use_cache=use_facet_cache)
+        nfaces = geometry_faces(quad_connectivity)
+        surface_dir = os.path.join(output_dir, name)
+        os.makedirs(surface_dir, exist_ok=True)
+        files = (os.path.join(surface_dir, "Geometry.dat"), os.path.join(surface_dir, "Loading.dat"))
+        write_geometry(name, xyz, normals, quad_connectivity, files[0])
+        surfaces.append((name, slice(offset, offset + xyz.shape[0]), nfaces, files))
+        offset += xyz.shape[0]
+
+    with open_taps(tapfile, fields=loading_fields, ref=ref, stationary=True, precision=float_type) as taps:
+        if offset != taps.npts:
+            raise ValueError(f"facet files have {offset} nodes but {tapfile} has {taps.npts} points")
+        ntime = taps.window(itstart, ntime)[1]
+        logger.info("streaming %d timesteps of %s into %d surfaces", ntime, tapfile, len(surfaces))
+
+        nbuffers = _pipeline_buffers if pipelined else 1
+        buffers = np.empty((nbuffers, min(chunk_size, ntime), len(loading_fields), taps.npts),
+                           dtype=float_types[float_type])
+        handles = [open(files[1], 'wb') for name, points, nfaces, files in surfaces]
+        try:
+            for f, (name, points, nfaces, files) in zip(handles, surfaces):
+                write_loading_header(f, name, ntime, points.stop - points.start, nfaces, float_type=float_type)
+
+            def write_block(t, loading_data):
+                for f, (name, points, nfaces, files) in zip(handles, surfaces):
+                    append_loading_data(f, t, loading_data[:, :, points], float_type=float_type)
+
+            blocks = _read_blocks(taps.iter_chunks(chunk_size=chunk_size, itstart=itstart, ntime=ntime),
+                                 copy=pipelined)
+            if pipelined:
+                blocks = prefetch(blocks)
+            writer = WriteBehind(write_block, depth=nbuffers - 2) if pipelined else contextlib.nullcontext()
+            with contextlib.closing(blocks), writer:
+                submit = writer.submit if pipelined else write_block
+                t0 = None
+                for i, (t, q) in enumerate(blocks):
+                    if t0 is None:
+                        t0 = t[0]
+                    loading_data = derive_loading(q, ref, out=buffers[i % nbuffers, :t.shape[0]])
+                    submit(t - t0, loading_data)
+        finally:
+            for f in handles:
+                f.close()
+
+    for name, points, nfaces, files in surfaces:
+        logger.info("wrote %s and %s", files[0], files[1])
+    return [files for name, points, nfaces, files in surfaces]
+
+def convert_surface_periodic(name, facetfile, tapfile, output_dir="wopwop_input_files", conversion=1,
+                             ref=None, period=None, tol=0.05, npts_estimate=64, float_type='single',
+                             use_facet_cache=False):
+    """
+    Converts one period of a tap file to PSU-WOPWOP geometry and periodic loading files.
+    The last period is compared with the one before it for every field and is only
+    written if they agree within `tol`. Only those two periods are loaded from the tap file.
+
+    Parameters
+    ----------
+    name : str
+        Surface name. Files are written to `output_dir/name/`.
+    facetfile : str
+        Path to the facet file the taps were created from.
+    tapfile : str
+        Path to the Helios tap file, e.g. 'extracts/tap_00.bin'. Times must be uniform.
+    output_dir : str, optional
+        Root output directory. Defaults to 'wopwop_input_files'.
+    conversion : float, optional
+        Multiplier converting facet units to meters.
+    ref : dict, optional
+        Reference values. Read from inputs.py with `read_taps.read_refs` if not given.
+    period : float, optional
+        Period of the loading, e.g. one rotor revolution. Estimated from the pressure
+        autocorrelation at `npts_estimate` points if not given.
+    tol : float, optional
+        Largest allowed difference between the last two periods, relative to the
+        range of each field. Defaults to 0.05.
+    npts_estimate : int, optional
+        Number of evenly spaced points used to estimate the period. Defaults to 64.
+    float_type : {'single', 'double'}, optional
+        Precision of the loading file. Defaults to 'single'.
+    use_facet_cache : bool, optional
+        Reuse the binary sidecar cache of the facet file, see `read_facet`.
+
+    Returns
+    -------
+    period : float
+        The period written, a whole number of timesteps.
+    errors : dict
+        Periodicity error of every loading field, see `periodic.periodicity_error`.
+
+    Raises
+    ------
+    ValueError
+        If a field is not periodic within `tol`, the data is shorter than two periods,
+        or the facet and tap file have different numbers of points.
+    """
+    if ref is None:
+        ref = tp.read_refs()
+
+    with tp.TapFile(tapfile, fields=loading_fields, ref=ref, stationary=True, validate=True) as taps:
+        t = np.asarray(taps.records()['time'])
+        if period is None:
+            points = np.linspace(0, taps.npts - 1, min(npts_estimate, taps.npts)).astype(int)
+            q = taps.records()['q'][:, points]
+            pressure = tp.compute_fields(q, ["Pressure"], ref)["Pressure"]
+            period = estimate_period(t, pressure)
+            logger.info("estimated period of %s seconds", period)
+
+        nkey = period_steps(t, period)
+        if 2*nkey > t.shape[0]:
+            raise ValueError(f"{tapfile} has {t.shape[0]} timesteps, fewer than two periods of {nkey}")
+        period = float(nkey*(t[-1] - t[0])/(t.shape[0] - 1))
+
+        records = taps.records(taps.nt - 2*nkey)
+        loading_data = derive_loading(records['q'], ref,
+                                      out=np.empty((2*nkey, len(loading_fields), taps.npts),
+                                                   dtype=float_types[float_type]))
+        tkey, key_data = extract_period(t, loading_data, period)
+
+    errors = {field: float(error) for field, error in zip(loading_fields, periodicity_error(loading_data, nkey))}
+    for field, error in errors.items():
+        logger.info("  %s differs by %.2e between the last two periods", field, error)
+    bad = [field for field, error in errors.items() if error > tol]
+    if bad:
+        raise ValueError(f"{', '.join(bad)} not periodic within {tol} over a period of {period}")
+
+    surface_dir = os.path.join(output_dir, name)
+    os.makedirs(surface_dir, exist_ok=True)
+    geometry_output_file = os.path.join(surface_dir, "Geometry.dat")
+    loading_output_file  = os.path.join(surface_dir, "Loading.dat")
+
+    xyz, normals, tri_connectivity, quad_connectivity = process_facet(facetfile, conversion=conversion,
+                                                                       use_cache=use_facet_cache)
+    npts = xyz.shape[0]
+    if npts != taps.npts:
+        raise ValueError(f"{facetfile} has {npts} nodes but {tapfile} has {taps.npts} points")
+    write_geometry(name, xyz, normals, quad_connectivity, geometry_output_file)
+    nfaces = geometry_faces(quad_connectivity)
+    with open(loading_output_file, 'wb') as f:
+        write_loading_header(f, name, nkey, npts, nfaces, float_type=float_type,
+                             loading_time_type='periodic', period=period)
+        append_loading_data(f, tkey, key_data, float_type=float_type)
+
+    logger.info("wrote %d timesteps of period %s to %s", nkey, period, loading_output_file)
+    return period, errors
+
+def _surface_result(surface):
+    name, facetfile, tapfile = surface
+    return {"name": name, "facetfile": facetfile, "tapfile": tapfile,
+            "files": None, "time": 0.0, "error": None, "performance": None}
+
+def _convert_surface_timed(surface, kwargs, spans=False):
+    """
+    Runs `convert_surface` for one (name, facetfile, tapfile) and records its time and
+    error. `spans` turns on the timing spans of the worker process, see `instrument.enable`.
+    """
+    if spans:
+        instrument.enable()
+    name, facetfile, tapfile = surface
+    result = _surface_result(surface)
+    if kwargs.get("resampler") is not None:
+        # resamplers hold the state of one time history, so every surface gets its own
+        kwargs = dict(kwargs, resampler=copy.deepcopy(kwargs["resampler"]))
+    start = time.perf_counter()
+    try:
+        result["files"] = convert_surface(name, facetfile, tapfile, **kwargs)
+        if kwargs.get("profile"):
+            with open(os.path.join(kwargs.get("output_dir", "wopwop_input_files"), name, "performance.json")) as f:
+                result["performance"] = json.load(f)
+    except Exception:
+        result["error"] = traceback.format_exc()
+    result["time"] = time.perf_counter() - start
+    return result
+
+def _convert_in_pool(surfaces, indices, kwargs, nprocs, results):
+    """
+    Converts the surfaces at `indices` in a process pool, filling `results`. Returns the
+    indices of the surfaces lost when a worker process died, e.g. killed out of memory,
+    which breaks the pool and every conversion still running in it.
+    """
+    lost = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=nprocs) as pool:
+        futures = {pool.submit(_convert_surface_timed, surfaces[i], kwargs, instrument.enabled()): i for i in indices}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except BrokenProcessPool:
+                lost.append(i)
+            except Exception:
+                results[i] = _surface_result(surfaces[i])
+                results[i]["error"] = traceback.format_exc()
+                results[i]["time"] = time.perf_counter() - start
+    return lost
+
+def convert_case(surfaces, nprocs=None, **kwargs):
+    """
+    Converts several surfaces with `convert_surface` across a pool of processes.
+    Surfaces are submitted largest tap file first so the longest conversions
+    start early, and a failing surface does not stop the others. If a worker
+    process dies, the surfaces lost with it are retried one at a time.
+
+    Parameters
+    ----------
+    surfaces : list of tuple
+        (name, facetfile, tapfile) for each surface. tapfile may be a list of the tap
+        files of a restarted run, see `convert_surface`.
+    nprocs : int, optional
+        Number of worker processes. Defaults to the number of CPUs. With 1, the
+        surfaces are converted one after another in the calling process.
+    **kwargs
+        Passed to `convert_surface`, e.g. conversion, output_dir, chunk_size.
+        If `ref` is not given it is read from inputs.py once, before the pool starts.
+
+    Returns
+    -------
+    list of dict
+        One entry per surface, in the order given, with keys 'name', 'facetfile',
+        'tapfile', 'files' (geometry and loading paths, None on failure),
+        'time' (seconds), 'error' (traceback string, None on success) and
+        'performance' (the report of `convert_surface` with `profile`, else None).
+    """
+    if kwargs.get("ref") is None:
+        kwargs["ref"] = tp.read_refs()
+
+    def size(surface):
+        tapfiles = [surface[2]] if isinstance(surface[2], str) else surface[2]
+        return sum(os.path.getsize(tapfile) for tapfile in tapfiles if os.path.isfile(tapfile))
+    order = sorted(range(len(surfaces)), key=lambda i: size(surfaces[i]), reverse=True)
+
+    results = [None]*len(surfaces)
+    if nprocs == 1:
+        for i in order:
+            results[i] = _convert_surface_timed(surfaces[i], kwargs)
+    else:
+        lost = _convert_in_pool(surfaces, order, kwargs, nprocs, results)
+        if lost:
+            # the surface that killed its worker is not known, so the surfaces lost with
+            # the pool are retried one at a time, each in a process of its own
+            logger.warning("a worker process died, retrying %d surfaces one at a time", len(lost))
+            for i in sorted(lost, key=order.index):
+                start = time.perf_counter()
+                if _convert_in_pool(surfaces, [i], kwargs, 1, results):
+                    results[i] = _surface_result(surfaces[i])
+                    results[i]["error"] = "the worker process converting this surface died, e.g. out of memory"
+                    results[i]["time"] = time.perf_counter() - start
+
+    for result in results:
+        if result["error"]:
+            logger.error("failed %s in %.2f s\n%s", result["name"], result["time"], result["error"])
+        else:
+            logger.info("converted %s in %.2f s", result["name"], result["time"])
+    return results
@@ -0,0 +1,173 @@
+"""
+Distribution of converted surfaces over parallel PSU-WOPWOP runs. The run time of a
+permeable surface grows with its number of nodes times its number of timesteps, and
+surfaces differ in size by orders of magnitude, so instead of one `cases.nam` listing
+every surface the surfaces are packed into groups of about equal cost, each with its
+own job directory and `cases.nam`, and a launch manifest describing the jobs.
+"""
+import heapq
+import json
+import logging
+import os
+import shutil
+
+from .write_loading import read_loading_header
+
+logger = logging.getLogger(__name__)
+
+def surface_cost(surface_dir, tapfile=None):
+    """
+    Estimates the PSU-WOPWOP cost of a surface as its number of nodes times timesteps.
+
+    The counts are read from the header of `surface_dir/Loading.dat`. Before the
+    surface is converted, they are taken from the index of its tap file instead.
+
+    Parameters
+    ----------
+    surface_dir : str
+        Directory of the surface, as written by `convert.convert_surface`.
+    tapfile : str, optional
+        Tap file of the surface, used if there is no loading file.
+
+    Returns
+    -------
+    int
+        Nodes times timesteps, 0 if neither file can be read.
+    """
+    loading_file = os.path.join(surface_dir, "Loading.dat")
+    if os.path.isfile(loading_file):
+        header = read_loading_header(loading_file)
+        return header["npts"]*header["nt"]
+    if tapfile is not None and os.path.isfile(tapfile):
+        from .tap_index import index_taps
+        index = index_taps(tapfile)
+        return index.npts*index.nvalid
+    return 0
+
+def pack_cases(costs, njobs):
+    """
+    Packs weighted cases into groups of about equal total cost, assigning the cases
+    from the most to the least expensive to the currently cheapest group.
+
+    Parameters
+    ----------
+    costs : dict
+        Cost of every case, keyed by case name.
+    njobs : int
+        Number of groups.
+
+    Returns
+    -------
+    groups : list of list
+        Case names of every group, most expensive first. Empty groups are dropped.
+    totals : list of int
+        Total cost of every group.
+    """
+    if njobs < 1:
+        raise ValueError("njobs must be at least 1")
+    heap = [(0, k) for k in range(njobs)]
+    groups = [[] for _ in range(njobs)]
+    totals = [0]*njobs
+    for name in sorted(costs, key=lambda name: costs[name], reverse=True):
+        total, k = heapq.heappop(heap)
+        groups[k].append(name)
+        totals[k] = total + costs[name]
+        heapq.heappush(heap, (totals[k], k))
+    used = [k for k in range(njobs) if groups[k]]
+    return [groups[k] for k in used], [totals[k] for k in used]
+
+def place_file(source, destination, link=True):
+    """
+    Places a copy of `source` at `destination`, replacing it. With `link`, a hard link
+    is made where possible, so one namelist is shared by every surface directory.
+    """
+    if os.path.lexists(destination):
+        if os.path.samefile(source, destination):
+            return
+        os.remove(destination)
+    if link:
+        try:
+            os.link(source, destination)
+            return
+        except OSError:
+            pass
+    shutil.copy2(source, destination)
+
+def write_cases_nam(cases_file, case_folders, namelist_file):
+    """Writes a cases.nam pointing PSU-WOPWOP to every case folder, with paths relative to it."""
+    with open(cases_file, "w") as f:
+        for case_folder in case_folders:
+            folder = os.path.relpath(case_folder, os.path.dirname(os.path.abspath(cases_file)))
+            f.write("&caseName\n")
+            f.write(f"globalFolderName='{folder}/'\n")
+            f.write(f"caseNameFile='{namelist_file}'\n")
+            f.write("/\n")
+
+def distribute_cases(input_dir="wopwop_input_files", namelist_file="wopwop.nam", njobs=1, link=True,
+                     tapfiles=None):
+    """
+    Sets up the PSU-WOPWOP runs of every surface in `input_dir`.
+
+    The namelist is placed in every surface directory and the surfaces are packed by
+    cost, see `surface_cost` and `pack_cases`, into `njobs` groups. With one job a
+    single `input_dir/cases.nam` is written. Otherwise every group gets a directory
+    `input_dir/job_NN` with its own `cases.nam`, so the jobs can run WOPWOP side by
+    side, each from its job directory. The jobs are described in
+    `input_dir/launch_manifest.json`.
+
+    Parameters
+    ----------
+    input_dir : str, optional
+        Directory holding one subdirectory per surface. Defaults to 'wopwop_input_files'.
+    namelist_file : str, optional
+        Namelist in `input_dir` to place in every surface directory. Defaults to 'wopwop.nam'.
+    njobs : int, optional
+        Number of parallel WOPWOP jobs. Defaults to 1.
+    link : bool, optional
+        Hard link the namelist instead of copying it where possible. Defaults to True.
+    tapfiles : dict, optional
+        Tap file of each surface name, used to estimate the cost of surfaces that
+        have no loading file yet.
+
+    Returns
+    -------
+    dict
+        The launch manifest: 'namelist', 'jobs' (one dict per job with 'directory',
+        'cases_file', 'surfaces' and 'cost') and 'costs' of every surface.
+    """
+    namelist = os.path.join(input_dir, namelist_file)
+    if not os.path.isfile(namelist):
+        raise FileNotFoundError(f"namelist {namelist} does not exist")
+    tapfiles = tapfiles or {}
+
+    surfaces = sorted(f.name for f in os.scandir(input_dir)
+                      if f.is_dir() and not (f.name.startswith("job_") and f.name[4:].isdigit()))
+    costs = {}
+    for name in surfaces:
+        surface_dir = os.path.join(input_dir, name)
+        place_file(namelist, os.path.join(surface_dir, namelist_file), link=link)
+        costs[name] = surface_cost(surface_dir, tapfiles.get(name))
+        if costs[name] == 0:
+            logger.warning("could not estimate the cost of %s", surface_dir)
+
+    groups, totals = pack_cases(costs, njobs)
+    jobs = []
+    for k, (group, total) in enumerate(zip(groups, totals)):
+        job_dir = input_dir if njobs == 1 else os.path.join(input_dir, f"job_{k:02}")
+        os.makedirs(job_dir, exist_ok=True)
+        cases_file = os.path.join(job_dir, "cases.nam")
+        write_cases_nam(cases_file, [os.path.join(input_dir, name) for name in group], namelist_file)
+        jobs.append({"directory": os.path.relpath(job_dir, input_dir),
+                     "cases_file": os.path.relpath(cases_file, input_dir),
+                     "surfaces": group, "cost": total})
+        logger.info("%s: %d surfaces, cost %d", cases_file, len(group), total)
+
+    manifest = {"namelist": namelist_file, "jobs": jobs, "costs": costs}
+    tmpfile = os.path.join(input_dir, "launch_manifest.json.tmp")
+    with open(tmpfile, "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmpfile, os.path.join(input_dir, "launch_manifest.json"))
+    if totals:
+        logger.info("packed %d surfaces into %d jobs, largest job has %.0f%% of the total cost",
+                    len(surfaces), len(jobs), 100*max(totals)/max(sum(totals), 1))
+    return manifest
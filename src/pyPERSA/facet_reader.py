@@ -1,16 +1,96 @@
 import numpy as np
+import itertools
+import logging
+import os
+
+from .spatial_hash import weld_points
+from .instrument import span
+
+logger = logging.getLogger(__name__)
+
 #############################
 #%% facet functions
 ############################
-def read_facet(facetfile):
+def _read_block(f, nlines, dtype):
+    """
+    Reads the next `nlines` lines of an open text file as one numeric block.
+
+    Returns
+    -------
+    numpy.ndarray
+        A (nlines, ncolumns) array, ncolumns taken from the first line.
+    """
+    lines = list(itertools.islice(f, nlines))
+    if len(lines) < nlines:
+        raise Exception(f"Facet file ended after {len(lines)} of {nlines} lines")
+    if nlines == 0:
+        return np.zeros((0, 0), dtype=dtype)
+    ncolumns = len(lines[0].split())
+    return np.fromstring(''.join(lines), dtype=dtype, sep=' ').reshape(nlines, ncolumns)
+
+def _facet_cache_file(facetfile):
+    return facetfile + ".npz"
+
+def _facet_signature(facetfile):
+    stat = os.stat(facetfile)
+    return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+def _load_facet_cache(facetfile):
+    """
+    Loads a facet from its binary sidecar cache if the cache matches the facet file's
+    size and modification time. Returns None if the cache is missing or stale.
+    """
+    cachefile = _facet_cache_file(facetfile)
+    if not os.path.isfile(cachefile):
+        return None
+    try:
+        with np.load(cachefile) as cache:
+            if not np.array_equal(cache["signature"], _facet_signature(facetfile)):
+                return None
+            coordinates = cache["coordinates"]
+            tri_connectivity  = cache["tri_connectivity"]  if cache["has_tri"]  else None
+            quad_connectivity = cache["quad_connectivity"] if cache["has_quad"] else None
+    except Exception:
+        return None
+    return coordinates, tri_connectivity, quad_connectivity
+
+def _write_facet_cache(facetfile, coordinates, tri_connectivity, quad_connectivity):
+    """Writes the sidecar cache of a facet file, skipping it if the folder cannot be written."""
+    cachefile = _facet_cache_file(facetfile)
+    tmpfile = cachefile + f".{os.getpid()}.tmp.npz"
+    try:
+        np.savez(tmpfile,
+                 signature=_facet_signature(facetfile),
+                 coordinates=coordinates,
+                 has_tri=tri_connectivity is not None,
+                 tri_connectivity=tri_connectivity if tri_connectivity is not None else np.zeros((0,3), dtype=int),
+                 has_quad=quad_connectivity is not None,
+                 quad_connectivity=quad_connectivity if quad_connectivity is not None else np.zeros((0,4), dtype=int))
+        os.replace(tmpfile, cachefile)
+    except OSError as e:
+        logger.debug("could not write the cache of %s: %s", facetfile, e)
+        try:
+            os.remove(tmpfile)
+        except OSError:
+            pass
+
+def read_facet(facetfile, use_cache=False):
     """
     Reads a .facet grid file and extracts grid coordinates and connectivity.
     Supports facet files containing triangles or quadrilaterals.
 
+    Coordinate and cell blocks are each parsed in one vectorized pass. With
+    `use_cache`, the parsed arrays are stored in a binary sidecar file
+    (`facetfile + '.npz'`) that is reused as long as the facet file's size and
+    modification time are unchanged. If the folder is read-only, the facet is
+    parsed without writing the cache.
+
     Parameters
     ----------
     facetfile : str
         Path to the facet file to be read.
+    use_cache : bool, optional
+        Read from and write to the binary sidecar cache. Defaults to False.
 
     Returns
     -------
@@ -23,11 +103,19 @@ def read_facet(facetfile):
         A (n_quads, 4) integer array defining quadrilateral connectivity, or None
         if no quadrilaterals are found. Indices correspond to columns in `coordinates`.
     """
-    print("--------------------------------------------------")
-    print(" reading facet file" + facetfile)
-    print("-------------------------------------------------")
-
-    with open(facetfile, 'r') as f:
+    logger.info("reading facet file %s", facetfile)
+
+    if use_cache:
+        with span("parse", _facet_cache_file(facetfile)) as s:
+            cached = _load_facet_cache(facetfile)
+            if cached is not None:
+                s.add(bytes_read=os.path.getsize(_facet_cache_file(facetfile)), points=cached[0].shape[0],
+                      array=cached[0])
+        if cached is not None:
+            logger.info("  found %d points in cache %s", cached[0].shape[0], _facet_cache_file(facetfile))
+            return cached
+
+    with span("parse", facetfile) as s, open(facetfile, 'r') as f:
         # First line is a facet header
         f.readline()  # Skip the first line
         f.readline()  # '1'
@@ -35,63 +123,113 @@ def read_facet(facetfile):
         f.readline()  # '0, 0.00 0.00 0.00 0.00'
 
         npoints = int(f.readline().strip())
-        print(f" Found {npoints} points")
-
-        # Allocate for coordinates
-        coordinates = np.zeros((npoints, 3))
+        logger.info("  found %d points", npoints)
 
         # Read coordinates
-        for i in range(npoints):
-            coordinates[i] = list(map(float, f.readline().split()))
+        coordinates = _read_block(f, npoints, float)[:, :3].copy()
 
         ncelltypes = int(f.readline().strip())
 
-        # connectivity = []
-        # # Reading cell types
-        # for i in range(ncelltypes):
-        #     f.readline()  # 'Quadrilaterals' or 'Triangles'
-        #     ncells, nedgescell = map(int, f.readline().split())
-        #     print(f" Found {ncells} {nedgescell}-sided cells")
-        #     for j in range(ncells):
-        #         corners = list(map(int, f.readline().split()))[:nedgescell]
-        #         connectivity.append(corners)
-
         tri_connectivity  = None
         quad_connectivity = None
         for i in range(ncelltypes):
             f.readline()  # 'Quadrilaterals' or 'Triangles'
             ncells, nedgescell = map(int, f.readline().split())
-            # print(f" Found {ncells} {nedgescell}-sided cells")
 
             if nedgescell == 3:
-                print(f" Found {ncells} triangles")
-
-                tri_connectivity = np.zeros((ncells,nedgescell), dtype=int)
-                for j in range(ncells):
-                    tri_connectivity[j] = list(map(int, f.readline().split()))[:nedgescell]
-
+                logger.info("  found %d triangles", ncells)
+                tri_connectivity = _read_block(f, ncells, int)[:, :nedgescell].copy()
 
             elif nedgescell == 4:
-                print(f" Found {ncells} quadrilaterals")
-
-                quad_connectivity = np.zeros((ncells,nedgescell), dtype=int)
-                for j in range(ncells):
-                    quad_connectivity[j] = list(map(int, f.readline().split()))[:nedgescell]
+                logger.info("  found %d quadrilaterals", ncells)
+                quad_connectivity = _read_block(f, ncells, int)[:, :nedgescell].copy()
 
             else:
-                print(" Sorry, only Quads or Tris are currently supported by facetReader.py")
-                print(" Stopping...")
+                logger.error("only quadrilaterals or triangles are supported, found cells with %d edges "
+                             "in %s", nedgescell, facetfile)
                 return
+        s.add(bytes_read=os.path.getsize(facetfile), points=npoints, array=coordinates)
 
-    print("Successfully Read Facet File")
-    print("--------------------------------------------------------")
+    if use_cache:
+        _write_facet_cache(facetfile, coordinates, tri_connectivity, quad_connectivity)
 
     return coordinates, tri_connectivity, quad_connectivity
 
+def face_normals(coordinates, connectivity):
+    """
+    Computes the cross product normal of every face in one vectorized pass.
+
+    Triangles (r1, r2, r3) use (r2 - r1) x (r3 - r1) and quadrilaterals
+    (r1, r2, r3, r4) use the diagonals (r3 - r1) x (r4 - r2), so both have
+    a magnitude of twice the face area.
+
+    Parameters
+    ----------
+    coordinates : numpy.ndarray
+        A (npoints, 3) array of vertex coordinates.
+    connectivity : numpy.ndarray
+        A (nfaces, 3) or (nfaces, 4) connectivity array with indices starting at 1.
+
+    Returns
+    -------
+    numpy.ndarray
+        A (nfaces, 3) array of face normals.
+    """
+    corners = coordinates[connectivity - 1]
+    if connectivity.shape[1] == 3:
+        return np.cross(corners[:,1] - corners[:,0], corners[:,2] - corners[:,0])
+    return np.cross(corners[:,2] - corners[:,0], corners[:,3] - corners[:,1])
+
+def vertex_normals(coordinates, tri_connectivity, quad_connectivity):
+    """
+    Accumulates face normals at the vertices of a mixed triangle/quadrilateral surface.
+
+    Parameters
+    ----------
+    coordinates : numpy.ndarray
+        A (npoints, 3) array of vertex coordinates.
+    tri_connectivity, quad_connectivity : numpy.ndarray or None
+        Connectivity arrays as returned by `read_facet`.
+
+    Returns
+    -------
+    numpy.ndarray
+        A (npoints, 3) array of vertex normals.
+
+    Raises
+    ------
+    Exception
+        If any face has a zero-magnitude normal, listing all of them.
+    """
+    normals = np.zeros((coordinates.shape[0], 3))
+
+    degenerate = []
+    for connectivity, cell_type in ((tri_connectivity, "triangle"), (quad_connectivity, "quadrilateral")):
+        if connectivity is None:
+            continue
+        vcross = face_normals(coordinates, connectivity)
+        zero = np.flatnonzero(~np.any(vcross, axis=1))
+        degenerate += [f"{cell_type} {i}" for i in zero]
+
+        # each face adds half its cross product, shared equally between its
+        # nodes. Connectivity indices start at 1 and python indices start at 0.
+        nnode_face = connectivity.shape[1]
+        contribution = 0.5*vcross/nnode_face
+        nodes = connectivity.ravel() - 1
+        for k in range(3):
+            normals[:,k] += np.bincount(nodes, weights=np.repeat(contribution[:,k], nnode_face),
+                                        minlength=coordinates.shape[0])
+
+    if degenerate:
+        raise Exception(f"{len(degenerate)} faces have a zero-magnitude normal: " + ", ".join(degenerate))
+
+    return normals
+
 # read points from facet file & calculate normals
-def process_facet(filename, conversion = 1):
+def process_facet(filename, conversion = 1, use_cache = False):
     """
     Reads a facet file, optionally scales, and computes vertex normal vectors.
+    Triangles and quadrilaterals in the same facet both contribute to the normals.
 
     Parameters
     ----------
@@ -100,6 +238,8 @@ def process_facet(filename, conversion = 1):
     conversion : float, optional
         Scaling factor multiplied to all coordinates (e.g., 0.0254 for in to m).
         PSU-WOPWOP requires inputs in meters.
+    use_cache : bool, optional
+        Passed to `read_facet` to reuse the binary sidecar cache. Defaults to False.
 
     Returns
     -------
@@ -117,51 +257,102 @@ def process_facet(filename, conversion = 1):
     Raises
     ------
     Exception
-        If a face has a zero-magnitude normal (i.e., degenerate geometry).
+        If any face has a zero-magnitude normal (i.e., degenerate geometry). All
+        degenerate faces are listed in the message.
     """
-    coordinates, tri_connectivity, quad_connectivity = read_facet(filename)
+    coordinates, tri_connectivity, quad_connectivity = read_facet(filename, use_cache=use_cache)
 
     coordinates *= conversion
 
-    normals = np.zeros((coordinates.shape[0], 3))
-
-    if tri_connectivity is not None:
-        nnode_face = 3
-        for i in range(tri_connectivity.shape[0]):
-            r1 = coordinates[tri_connectivity[i,0]-1] # subtract 1 because connectivity
-            r2 = coordinates[tri_connectivity[i,1]-1] # indices start at 1 and python
-            r3 = coordinates[tri_connectivity[i,2]-1] # indices start at 0
-
-            v1 = r2 - r1
-            v2 = r3 - r1
-
-            vcross = np.cross(v1, v2)
-
-            if np.linalg.norm(vcross) == 0:
-                raise Exception("Face {i} has a zero-magnitude normal!")
-
-            for j in range(nnode_face):
-                normals[tri_connectivity[i,j]-1] = normals[tri_connectivity[i,j]-1] + \
-                    0.5*vcross/nnode_face
+    with span("normals", filename) as s:
+        normals = vertex_normals(coordinates, tri_connectivity, quad_connectivity)
+        s.add(points=coordinates.shape[0], array=normals)
 
-    elif quad_connectivity is not None:
-        nnode_face = 4
-        for i in range(quad_connectivity.shape[0]):
-            r1 = coordinates[quad_connectivity[i,0]-1]
-            r2 = coordinates[quad_connectivity[i,1]-1]
-            r3 = coordinates[quad_connectivity[i,2]-1]
-            r4 = coordinates[quad_connectivity[i,3]-1]
-
-            v1 = r3 - r1
-            v2 = r4 - r2
+    return coordinates, normals, tri_connectivity, quad_connectivity
 
-            vcross = np.cross(v1, v2)
+def write_facet(facetfile, coordinates, tri_connectivity, quad_connectivity):
+    """
+    Writes coordinates and connectivity to a .facet file readable by `read_facet`.
 
-            if np.linalg.norm(vcross) == 0:
-                raise Exception("Face {i} has a zero-magnitude normal!")
+    Parameters
+    ----------
+    facetfile : str
+        Path to the facet file to be written.
+    coordinates : numpy.ndarray
+        A (npoints, 3) array of vertex coordinates.
+    tri_connectivity, quad_connectivity : numpy.ndarray or None
+        Connectivity arrays with indices starting at 1, as returned by `read_facet`.
+    """
+    celltypes = [(c, name) for c, name in ((tri_connectivity, "Triangles"), (quad_connectivity, "Quadrilaterals"))
+                 if c is not None]
+    with open(facetfile, 'w') as f:
+        f.write("FACET FILE V3.0\n1\nGrid\n0, 0.00 0.00 0.00 0.00\n")
+        f.write(f"{coordinates.shape[0]}\n")
+        np.savetxt(f, coordinates, fmt='%.10e')
+        f.write(f"{len(celltypes)}\n")
+        for connectivity, name in celltypes:
+            f.write(f"{name}\n{connectivity.shape[0]} {connectivity.shape[1]}\n")
+            # trailing part and surface ids, ignored by read_facet
+            np.savetxt(f, np.column_stack((connectivity, np.zeros(connectivity.shape[0], dtype=int),
+                                           np.ones(connectivity.shape[0], dtype=int))), fmt='%d')
+
+def merge_facets(facetfiles, tol, conversion = 1, use_cache = False):
+    """
+    Concatenates several facet files and welds coincident nodes, so nodes shared
+    along the edges of separately exported faces become a single tap.
 
-            for j in range(nnode_face):
-                normals[quad_connectivity[i,j]-1] = normals[quad_connectivity[i,j]-1] + \
-                    0.5*vcross/nnode_face
+    Parameters
+    ----------
+    facetfiles : list of str
+        Paths to the facet files to merge.
+    tol : float
+        Nodes closer than this distance, after scaling by `conversion`, are welded.
+    conversion : float, optional
+        Scaling factor multiplied to all coordinates, see `process_facet`.
+    use_cache : bool, optional
+        Passed to `read_facet` to reuse the binary sidecar caches. Defaults to False.
 
-    return coordinates, normals, tri_connectivity, quad_connectivity
+    Returns
+    -------
+    coordinates : numpy.ndarray
+        A (npoints, 3) array of welded, scaled vertex coordinates.
+    normals : numpy.ndarray
+        A (npoints, 3) array of vertex normals recomputed on the welded surface.
+    tri_connectivity, quad_connectivity : numpy.ndarray or None
+        Remapped connectivity arrays. Faces that collapse when their nodes are
+        welded are removed.
+    node_map : numpy.ndarray
+        Index of the welded node of every node of the concatenated input files.
+    """
+    coordinates, tris, quads = [], [], []
+    offset = 0
+    for facetfile in facetfiles:
+        xyz, tri_connectivity, quad_connectivity = read_facet(facetfile, use_cache=use_cache)
+        coordinates.append(xyz*conversion)
+        if tri_connectivity is not None:
+            tris.append(tri_connectivity + offset)
+        if quad_connectivity is not None:
+            quads.append(quad_connectivity + offset)
+        offset += xyz.shape[0]
+    coordinates = np.concatenate(coordinates)
+
+    unique, node_map = weld_points(coordinates, tol)
+    merged = coordinates[unique]
+
+    def remap(connectivity):
+        if not connectivity:
+            return None
+        connectivity = node_map[np.concatenate(connectivity) - 1] + 1
+        # drop faces that lost a corner to welding
+        corners = np.sort(connectivity, axis=1)
+        collapsed = np.any(corners[:,1:] == corners[:,:-1], axis=1)
+        if collapsed.any():
+            logger.info("  removed %d faces collapsed by welding", collapsed.sum())
+        return connectivity[~collapsed] if not collapsed.all() else None
+
+    tri_connectivity, quad_connectivity = remap(tris), remap(quads)
+    normals = vertex_normals(merged, tri_connectivity, quad_connectivity)
+
+    logger.info("merged %d facet files: welded %d nodes into %d, saving %d taps", len(facetfiles),
+                coordinates.shape[0], merged.shape[0], coordinates.shape[0] - merged.shape[0])
+    return merged, normals, tri_connectivity, quad_connectivity, node_map
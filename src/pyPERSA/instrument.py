@@ -0,0 +1,205 @@
+"""
+Opt-in instrumentation of the conversion stages. Every stage (parse, normals, read,
+derive, write) runs inside a `span` that, when instrumentation is enabled, times it,
+counts the bytes it read or wrote, the points*steps it processed and the size of the
+largest array it produced, logs a debug message and adds it to the active report.
+When disabled, `span` returns a shared object whose methods do nothing, so the
+instrumented code pays one global lookup per call.
+
+Messages are sent to the "pyPERSA" logger hierarchy. Enable the timings with `enable()`,
+or collect a per-surface JSON report with `surface_report`, which enables them for
+its duration. Show the messages with e.g.
+
+    import logging
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_enabled = False
+_report  = None
+
+def enable(on=True):
+    """Turns the timing spans on or off for this process."""
+    global _enabled
+    _enabled = bool(on)
+
+def enabled():
+    """Returns True if spans are being recorded."""
+    return _enabled
+
+class _NullSpan:
+    """The span returned while instrumentation is disabled."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def add(self, bytes_read=0, bytes_written=0, points=0, array=None):
+        pass
+
+_null_span = _NullSpan()
+
+class Span:
+    """
+    Timing and counters of one run of a stage. Use through `span`.
+
+    Attributes
+    ----------
+    stage : str
+        Stage name, e.g. 'read'.
+    detail : str
+        What was processed, e.g. a file name.
+    seconds : float
+        Wall-clock duration, set on exit.
+    bytes_read, bytes_written : int
+        Bytes moved from or to disk.
+    points : int
+        Points*steps, or nodes, processed.
+    peak_array_bytes : int
+        Size of the largest array passed to `add`.
+    """
+    __slots__ = ('stage', 'detail', 'start', 'seconds', 'bytes_read', 'bytes_written', 'points',
+                 'peak_array_bytes', 'report')
+
+    def __init__(self, stage, detail, report):
+        self.stage   = stage
+        self.detail  = detail
+        self.report  = report
+        self.seconds = 0.0
+        self.bytes_read       = 0
+        self.bytes_written    = 0
+        self.points           = 0
+        self.peak_array_bytes = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds = time.perf_counter() - self.start
+        nbytes = self.bytes_read + self.bytes_written
+        rate = f", {nbytes/2**20/self.seconds:.1f} MB/s" if nbytes and self.seconds > 0 else ""
+        detail = f" {self.detail}" if self.detail else ""
+        logger.debug("%s%s took %.4f s%s", self.stage, detail, self.seconds, rate)
+        if self.report is not None:
+            self.report.add(self)
+        return False
+
+    def add(self, bytes_read=0, bytes_written=0, points=0, array=None):
+        """Adds to the counters of the span. `array` updates the peak array size."""
+        self.bytes_read    += int(bytes_read)
+        self.bytes_written += int(bytes_written)
+        self.points        += int(points)
+        if array is not None:
+            self.peak_array_bytes = max(self.peak_array_bytes, int(array.nbytes))
+
+def span(stage, detail=""):
+    """
+    Returns a context manager timing one run of `stage`, see `Span`. It does nothing
+    while instrumentation is disabled.
+
+    Examples
+    --------
+    >>> with span("write", filename) as s:
+    ...     f.write(data)
+    ...     s.add(bytes_written=data.nbytes)
+    """
+    if not _enabled:
+        return _null_span
+    return Span(stage, detail, _report)
+
+class PerfReport:
+    """
+    Spans collected while converting one surface, summed by stage. Spans may be added
+    from several threads, e.g. by a pipelined conversion.
+
+    Parameters
+    ----------
+    name : str
+        Surface name.
+    """
+    __slots__ = ('name', 'stages', 'wall_seconds', '_lock')
+
+    def __init__(self, name):
+        self.name   = name
+        self.stages = {}
+        self.wall_seconds = 0.0
+        self._lock  = threading.Lock()
+
+    def add(self, s):
+        with self._lock:
+            stage = self.stages.setdefault(s.stage, {"calls": 0, "seconds": 0.0, "bytes_read": 0,
+                                                     "bytes_written": 0, "points": 0, "peak_array_bytes": 0})
+            stage["calls"]         += 1
+            stage["seconds"]       += s.seconds
+            stage["bytes_read"]    += s.bytes_read
+            stage["bytes_written"] += s.bytes_written
+            stage["points"]        += s.points
+            stage["peak_array_bytes"] = max(stage["peak_array_bytes"], s.peak_array_bytes)
+
+    def to_dict(self):
+        """
+        Returns the report as a dict with the surface name, its wall-clock time and,
+        for every stage, its totals with throughput in MB/s and points per second.
+        Stages overlap in pipelined conversions, so their times can add up to more
+        than the wall-clock time.
+        """
+        stages = {}
+        for name, stage in self.stages.items():
+            seconds = stage["seconds"]
+            nbytes = stage["bytes_read"] + stage["bytes_written"]
+            stages[name] = dict(stage, mb_per_s=nbytes/2**20/seconds if seconds > 0 else None,
+                                points_per_s=stage["points"]/seconds if seconds > 0 else None)
+        return {"name": self.name, "wall_seconds": self.wall_seconds, "stages": stages}
+
+class surface_report:
+    """
+    Context manager that enables the spans and collects them into a `PerfReport`
+    for its duration, optionally writing the report as JSON on exit.
+
+    Parameters
+    ----------
+    name : str
+        Surface name.
+    path : str, optional
+        JSON file the report is written to.
+
+    Examples
+    --------
+    >>> with surface_report("blade", "wopwop_input_files/blade/performance.json") as report:
+    ...     convert_surface("blade", ...)
+    """
+    __slots__ = ('report', 'path', '_previous', '_start')
+
+    def __init__(self, name, path=None):
+        self.report = PerfReport(name)
+        self.path   = path
+
+    def __enter__(self):
+        global _enabled, _report
+        self._previous = (_enabled, _report)
+        _enabled, _report = True, self.report
+        self._start = time.perf_counter()
+        return self.report
+
+    def __exit__(self, exc_type, exc, tb):
+        global _enabled, _report
+        self.report.wall_seconds = time.perf_counter() - self._start
+        _enabled, _report = self._previous
+        if self.path is not None:
+            tmpfile = self.path + ".tmp"
+            with open(tmpfile, 'w') as f:
+                json.dump(self.report.to_dict(), f, indent=1)
+            os.replace(tmpfile, self.path)
+        logger.info("%s: %s", self.report.name, ", ".join(
+            f"{name} {stage['seconds']:.2f} s" for name, stage in self.report.stages.items()))
+        return False
@@ -0,0 +1,128 @@
+"""
+Functions that find and extract one period of periodic loading data, so rotor cases that
+have settled into a periodic state can be written as periodic PSU-WOPWOP loading instead
+of integrating many identical revolutions.
+"""
+import numpy as np
+
+def uniform_dt(t, rtol=1e-3):
+    """
+    Returns the time step of a uniformly sampled time series.
+
+    Raises
+    ------
+    ValueError
+        If the steps differ by more than `rtol` relative to their median.
+    """
+    steps = np.diff(t)
+    dt = np.median(steps)
+    if steps.size == 0 or dt <= 0 or np.abs(steps - dt).max() > rtol*dt:
+        raise ValueError("time steps are not uniform, resample with resample.UniformResampler first")
+    return dt
+
+def estimate_period(t, signal, min_period=None, max_period=None):
+    """
+    Estimates the period of a signal from the first peak of its unbiased
+    autocorrelation, computed with FFTs for all points at once.
+
+    Parameters
+    ----------
+    t : numpy.ndarray
+        (nt,) uniformly spaced times.
+    signal : numpy.ndarray
+        (nt,) or (nt, npts) signal, e.g. the pressure at a subset of points. The
+        autocorrelations of all points are summed.
+    min_period, max_period : float, optional
+        Range of periods searched. Defaults to the first zero crossing of the
+        autocorrelation up to half the length of the signal.
+
+    Returns
+    -------
+    float
+        The estimated period.
+    """
+    dt = uniform_dt(t)
+    x = signal.reshape(signal.shape[0], -1)
+    x = x - x.mean(axis=0)
+    nt = x.shape[0]
+
+    spectrum = np.fft.rfft(x, n=2*nt, axis=0)
+    ac = np.fft.irfft(np.abs(spectrum)**2, axis=0)[:nt].sum(axis=1)
+    # unbiased estimate: lag k sums nt - k products, otherwise short lags are favoured
+    ac /= nt - np.arange(nt)
+    if ac[0] <= 0:
+        raise ValueError("signal is constant, cannot estimate a period")
+    ac /= ac[0]
+
+    lag0 = int(np.ceil(min_period/dt)) if min_period else int(np.argmax(ac < 0))
+    lag1 = int(max_period/dt) + 1 if max_period else nt//2 + 1
+    lag1 = min(lag1, nt - 1)
+    if lag0 <= 0 or lag0 >= lag1:
+        raise ValueError("signal is too short to estimate a period")
+
+    # multiples of the period correlate as well as the period itself, so take the
+    # first peak within 10% of the highest one
+    window = ac[lag0:lag1]
+    i = int(np.argmax(window >= 0.9*window.max()))
+    while i + 1 < window.size and window[i+1] > window[i]:
+        i += 1
+    lag = lag0 + i
+    # refine the peak with a parabola through its neighbours
+    if 0 < lag < nt - 1:
+        a, b, c = ac[lag-1], ac[lag], ac[lag+1]
+        if a - 2*b + c < 0:
+            lag = lag + 0.5*(a - c)/(a - 2*b + c)
+    return lag*dt
+
+def periodicity_error(data, nkey):
+    """
+    Compares the last period of data with the period before it, separately for
+    each field.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        (nt, nfields, npts) data with nt >= 2*nkey.
+    nkey : int
+        Number of timesteps per period.
+
+    Returns
+    -------
+    numpy.ndarray
+        (nfields,) maximum difference between the two periods, relative to the
+        peak-to-peak range of the field over the last period.
+    """
+    last     = data[-nkey:]
+    previous = data[-2*nkey:-nkey]
+    difference = np.abs(last - previous).max(axis=(0, 2))
+    scale = np.ptp(last, axis=(0, 2))
+    return difference/np.where(scale > 0, scale, 1)
+
+def extract_period(t, data, period):
+    """
+    Picks out the last full period of uniformly sampled data.
+
+    Parameters
+    ----------
+    t : numpy.ndarray
+        (nt,) uniformly spaced times.
+    data : numpy.ndarray
+        (nt, ...) data.
+    period : float
+        The period.
+
+    Returns
+    -------
+    t : numpy.ndarray
+        (nkey,) times of the period, starting at 0.
+    data : numpy.ndarray
+        (nkey, ...) view of the data of the period.
+    """
+    nkey = period_steps(t, period)
+    if nkey > t.shape[0]:
+        raise ValueError(f"data is shorter than one period ({nkey} timesteps)")
+    return t[-nkey:] - t[-nkey], data[-nkey:]
+
+def period_steps(t, period):
+    """Returns the number of timesteps in one period of uniformly sampled times."""
+    return int(round(period/uniform_dt(t)))
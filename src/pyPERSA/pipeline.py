@@ -0,0 +1,146 @@
+"""
+Threaded stages for streamed conversions. A reader thread prefetches the next blocks of
+tap records while the current block is derived, and a writer thread writes the previous
+block behind it, so disk reads, field derivation and disk writes overlap. numpy copies,
+ufuncs and file writes release the GIL, so plain threads are enough to keep the disk
+and the CPU busy at the same time.
+
+Stages are connected by bounded queues: a stage that runs ahead blocks until the next
+stage catches up, so memory use stays at a few blocks whatever the speed of the disk.
+"""
+import queue
+import threading
+
+# marks the end of a queue
+_DONE = object()
+
+class _Failure:
+    """Carries an exception raised in a stage thread to the thread consuming its output."""
+    __slots__ = ('error',)
+
+    def __init__(self, error):
+        self.error = error
+
+def _put(q, item, stop):
+    """Puts an item on a bounded queue, giving up once `stop` is set. Returns False if it gave up."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+def prefetch(blocks, depth=2):
+    """
+    Iterates over `blocks` in a background thread, holding at most `depth` blocks ahead
+    of the consumer. Each block must be fully read by the time it is produced, e.g.
+    copied out of a memory map, or the reads still happen in the consuming thread.
+
+    Parameters
+    ----------
+    blocks : iterable
+        Blocks to produce, e.g. a generator reading tap records.
+    depth : int, optional
+        Number of blocks read ahead. Defaults to 2.
+
+    Yields
+    ------
+    object
+        The blocks of `blocks`, in order. An exception raised while producing them
+        is raised in the consumer.
+    """
+    q = queue.Queue(maxsize=max(int(depth), 1))
+    stop = threading.Event()
+
+    def run():
+        try:
+            for block in blocks:
+                if not _put(q, block, stop):
+                    return
+        except BaseException as e:
+            _put(q, _Failure(e), stop)
+            return
+        _put(q, _DONE, stop)
+
+    thread = threading.Thread(target=run, name="pyPERSA-prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            block = q.get()
+            if block is _DONE:
+                break
+            if isinstance(block, _Failure):
+                raise block.error
+            yield block
+    finally:
+        # unblock and stop the reader if the consumer stops early
+        stop.set()
+        thread.join()
+
+class WriteBehind:
+    """
+    Calls `write` on submitted items in a background thread, in submission order.
+    `submit` blocks while `depth` items are waiting. An exception raised by `write`
+    stops the writer and is raised by the next `submit` or by `close`.
+
+    Parameters
+    ----------
+    write : callable
+        Called with the arguments of every `submit`.
+    depth : int, optional
+        Number of items waiting to be written. Defaults to 2.
+    """
+    __slots__ = ('write', '_queue', '_stop', '_error', '_thread')
+
+    def __init__(self, write, depth=2):
+        self.write   = write
+        self._queue  = queue.Queue(maxsize=max(int(depth), 1))
+        self._stop   = threading.Event()
+        self._error  = None
+        self._thread = threading.Thread(target=self._run, name="pyPERSA-write", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                args = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if args is _DONE:
+                return
+            try:
+                self.write(*args)
+            except BaseException as e:
+                self._error = e
+                self._stop.set()
+                return
+
+    def _raise(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def submit(self, *args):
+        """Queues `write(*args)`, waiting while the queue is full."""
+        if not _put(self._queue, args, self._stop):
+            self._raise()
+            raise RuntimeError("the writer has been stopped")
+
+    def close(self):
+        """Waits for every submitted item to be written."""
+        if self._thread.is_alive():
+            _put(self._queue, _DONE, self._stop)
+            self._thread.join()
+        self._raise()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # stop without writing what is still queued, keep the original exception
+            self._stop.set()
+            self._thread.join()
@@ -5,83 +5,387 @@ See example file for usage
 """
 
 import numpy as np
-import sys
+import logging
 import pickle
 
+from .instrument import span
+
+logger = logging.getLogger(__name__)
+
 taps_file  = None
 ref        = None
 fields     = ["Density", "XMomentum"]
 stationary = False
+precision  = 'double'
+
+# dtype of derived fields for each precision. Fields are always computed in
+# float64 and cast tile by tile, so 'single' never materializes a float64 copy.
+precisions = {'single': np.float32, 'double': np.float64}
+
+# Fields are derived from the conserved variables q = (rho, rho u, rho v, rho w, E).
+# Each derived field is a function of a memoized getter v(name) and the reference
+# values, so shared subexpressions like the kinetic energy are computed once per tile.
+conserved = {"Density": 0, "XMomentum": 1, "YMomentum": 2, "ZMomentum": 3, "Energy": 4}
+derived = {}
+derived["KineticEnergy"]        = lambda v, r: 0.5*(v("XMomentum")**2 + v("YMomentum")**2 + v("ZMomentum")**2)/v("Density")
+derived["Pressure"]             = lambda v, r: (r['gamma']-1)*(v("Energy") - v("KineticEnergy"))
+derived["PressurePerturbation"] = lambda v, r: v("Pressure") - r['pinf']
+derived["XVelocity"]            = lambda v, r: v("XMomentum")/v("Density")
+derived["YVelocity"]            = lambda v, r: v("YMomentum")/v("Density")
+derived["ZVelocity"]            = lambda v, r: v("ZMomentum")/v("Density")
+derived["Temperature"]          = lambda v, r: v("Pressure")/(v("Density")*r['rgas'])
+derived["SoundSpeed"]           = lambda v, r: np.sqrt(r['gamma']*v("Pressure")/v("Density"))
+derived["Mach"]                 = lambda v, r: np.sqrt(2*v("KineticEnergy")/(r['gamma']*v("Pressure")))
 
+# each field takes q and optionally the reference values to use instead of
+# the module-level ref, so TapFile instances don't depend on module state
 allfields = {}
-allfields["Density"]           = lambda q: q[:,:,0]
-allfields["XMomentum"]         = lambda q: q[:,:,1]
-allfields["YMomentum"]         = lambda q: q[:,:,2]
-allfields["ZMomentum"]         = lambda q: q[:,:,3]
-allfields["Pressure"]          = lambda q: (ref['gamma']-1)*(q[:,:,4]-0.5*(q[:,:,1]**2 + q[:,:,2]**2 + q[:,:,3]**2)/q[:,:,0])
+for _field in list(conserved) + list(derived):
+    allfields[_field] = lambda q, refs=None, _field=_field: compute_fields(q, [_field], refs)[_field]
+
+def _tiles(nt, npts, tile):
+    """Yields (it0, it1, ip0, ip1) blocks of about `tile` points covering an (nt, npts) array."""
+    if npts >= tile:
+        for it in range(nt):
+            for ip in range(0, npts, tile):
+                yield it, it+1, ip, min(ip+tile, npts)
+    else:
+        step = max(tile//max(npts,1), 1)
+        for it in range(0, nt, step):
+            yield it, min(it+step, nt), 0, npts
+
+def compute_fields(q, names, refs=None, out=None, dtype=np.float64, tile=8192):
+    """
+    Computes several fields from the conserved variables in one blocked pass over q.
+
+    q is processed in tiles of about `tile` points that are copied into a small
+    contiguous buffer, so every field is computed while the tile is in cache and
+    each element of q is read from memory once. Shared subexpressions such as the
+    kinetic energy and pressure are evaluated once per tile, and all arithmetic is
+    done in float64 before results are cast to the output dtype.
+
+    Parameters
+    ----------
+    q : numpy.ndarray
+        A (nt, npts, nq) array of conserved variables, possibly a strided view.
+    names : list of str
+        Keys of `allfields` to compute.
+    refs : dict, optional
+        Reference values, defaults to the module-level ref. Needed for every
+        field derived from the pressure.
+    out : dict, optional
+        Preallocated (nt, npts) arrays keyed by field name. Missing fields are
+        allocated with `dtype`.
+    dtype : numpy.dtype, optional
+        Dtype of allocated outputs. Defaults to float64.
+    tile : int, optional
+        Number of points per tile. Defaults to 8192.
+
+    Returns
+    -------
+    dict
+        (nt, npts) arrays keyed by field name.
+    """
+    refs = refs or ref
+    nt, npts, nq = q.shape
+    out = {} if out is None else dict(out)
+    for name in names:
+        if name not in allfields:
+            raise ValueError("Did not recognize: "+str(name))
+        if name not in out:
+            out[name] = np.empty((nt, npts), dtype=dtype)
+
+    scratch = np.empty((max(min(tile, nt*npts), 1), nq))
+    for it0, it1, ip0, ip1 in _tiles(nt, npts, tile):
+        n = (it1 - it0)*(ip1 - ip0)
+        block = scratch[:n]
+        block.reshape(it1 - it0, ip1 - ip0, nq)[...] = q[it0:it1, ip0:ip1]
+
+        cache = {}
+        def v(name):
+            if name not in cache:
+                if name in conserved:
+                    cache[name] = block[:,conserved[name]]
+                else:
+                    cache[name] = derived[name](v, refs)
+            return cache[name]
+
+        for name in names:
+            out[name][it0:it1, ip0:ip1] = v(name).reshape(it1 - it0, ip1 - ip0)
+    return {name: out[name] for name in names}
+
+def tap_dtype(npts, nq):
+    """
+    Structured dtype describing one fixed-size record of a Helios tap file.
 
+    Each record is laid out as two int headers (nq, npts), the physical time,
+    the (npts, 3) coordinate block and the (npts, nq) conserved variable block.
+    The dtype is packed so its itemsize equals the on-disk record size.
+
+    Parameters
+    ----------
+    npts : int
+        Number of tap points per record.
+    nq : int
+        Number of variables per point.
+
+    Returns
+    -------
+    numpy.dtype
+        Structured dtype with fields 'nq', 'npts', 'time', 'xyz' and 'q'.
+    """
+    return np.dtype([('nq',   np.intc),
+                     ('npts', np.intc),
+                     ('time', np.double),
+                     ('xyz',  np.double, (npts, 3)),
+                     ('q',    np.double, (npts, nq))])
 
 def tapinfo(taps_file):
-    fsize,dsize,isize,csize=4,8,4,1 # float size
+    isize = 4 # int size
     with open(taps_file, mode='rb') as f: 
         bindata  = f.read(2*isize)
         nq, npts = np.ndarray((2), dtype=np.intc, buffer=bindata, offset=0)
-        f.seek(0)
-        nt=0
-        entrysize = 2*isize + dsize + 3*npts*dsize + nq*npts*dsize
+        entrysize = tap_dtype(npts, nq).itemsize
         end = f.seek(0,2) # end of file
         nt = int(end/entrysize)
     return nt,npts,nq
 
-def readtaps(taps_file,itstart=0,ntime=-1):
-    
-    print("--------------------------------------------------")
-    print("reading .bin file")
-    print("-------------------------------------------------")
-    
-    global stationary
+def memmap_taps(taps_file, itstart=0, ntime=-1):
+    """
+    Memory-maps a range of records of a tap file without reading it.
+
+    Parameters
+    ----------
+    taps_file : str
+        Path to the tap file.
+    itstart : int, optional
+        First record to map. Defaults to 0.
+    ntime : int, optional
+        Number of records to map, -1 maps to the end of the file.
+
+    Returns
+    -------
+    numpy.memmap
+        A (ntime,) structured array with dtype `tap_dtype(npts, nq)`. Pages are
+        only read from disk when the corresponding fields are accessed.
+    """
     nt,npts,nq = tapinfo(taps_file)
-    # print(nt,npts,nq)
-    if(ntime==-1):
-        ntime = nt
-    fsize,dsize,isize,csize=4,8,4,1 # float size
-    entrysize = 2*isize + dsize + 3*npts*dsize + nq*npts*dsize
-    with open(taps_file, mode='rb') as f: 
-        f.seek(itstart*entrysize)
-        readsize = np.int64(ntime)*np.int64(entrysize)
-        print("  readsize is " + str(readsize) + " bytes")
-        bindata = f.read(readsize)
-    print("  bindata read successful.")
-    size = np.ndarray((-1), dtype=np.byte, buffer=bindata, offset=0).size # size of whole dataset
-    loc,q,x,t = np.int64(0),[],[],[]
-    
-    print(f"  readtaps found {npts} points.")
-    print(f"  readtaps found {nt} timesteps.")
-    
-    while(loc < size):
-        nq, npts = np.ndarray((2),       dtype=np.intc,   buffer=bindata, offset=loc)
-        loc     += 2*isize
-        time     = np.ndarray((1),        dtype=np.double, buffer=bindata, offset=loc)
-        loc     += dsize
-        xx       = np.ndarray((npts,3), dtype=np.double, buffer=bindata, offset=loc)
-        loc     += 3*npts*dsize
-        qq       = np.ndarray((npts,nq), dtype=np.double, buffer=bindata, offset=loc)
-        loc     += nq*npts*dsize
-        t.append(time[0])
-        q.append(qq)
-        
-        if stationary:
-            if len(x) == 0:
-                x = np.squeeze(xx)
+    itstart = min(max(itstart, 0), nt)
+    if ntime == -1 or itstart + ntime > nt:
+        ntime = nt - itstart
+    dtype = tap_dtype(npts, nq)
+    if ntime == 0:
+        return np.zeros((0), dtype=dtype)
+    return np.memmap(taps_file, dtype=dtype, mode='r',
+                     offset=np.int64(itstart)*dtype.itemsize, shape=(ntime,))
+
+def readtaps(taps_file,itstart=0,ntime=-1):
+    """
+    Reads a range of timesteps of a tap file as zero-copy views.
+
+    The file is memory-mapped with a structured record dtype, so the returned
+    arrays are strided views into the page cache rather than copies. Only the
+    pages touched by later computations are read from disk.
+
+    Parameters
+    ----------
+    taps_file : str
+        Path to the tap file.
+    itstart : int, optional
+        First timestep to read. Defaults to 0.
+    ntime : int, optional
+        Number of timesteps to read, -1 reads to the end of the file.
+
+    Returns
+    -------
+    t : numpy.ndarray
+        A (ntime,) array of physical times.
+    x : numpy.ndarray
+        A (npts, 3) array of coordinates at the first timestep if `stationary`
+        is set, otherwise a (ntime, npts, 3) array.
+    q : numpy.ndarray
+        A (ntime, npts, nq) array of conserved variables.
+    """
+    logger.info("reading %s", taps_file)
+
+    with TapFile(taps_file, stationary=stationary) as taps:
+        logger.info("  readtaps found %d points and %d timesteps", taps.npts, taps.nt)
+        return taps.readtaps(itstart=itstart, ntime=ntime)
+
+def point_selection(points, npts):
+    """
+    Converts a selection of tap points to an index usable on the point axis.
+
+    Parameters
+    ----------
+    points : None, slice, tuple, or array_like
+        None for every point, a slice or (start, stop) range, a boolean mask of
+        length npts, or an array of point indices.
+    npts : int
+        Number of points in the tap file.
+
+    Returns
+    -------
+    slice or numpy.ndarray
+        A slice whenever the selection is evenly spaced, so indexing returns a
+        strided view, otherwise an integer index array.
+    """
+    if points is None:
+        return slice(None)
+    if isinstance(points, slice):
+        return points
+    if isinstance(points, tuple):
+        return slice(*points)
+    points = np.asarray(points)
+    if points.dtype == bool:
+        if points.shape != (npts,):
+            raise ValueError(f"point mask has shape {points.shape}, expected ({npts},)")
+        points = np.flatnonzero(points)
+    points = points.astype(np.int64).ravel()
+    if points.size > 0 and points.min() >= 0:
+        steps = np.diff(points)
+        if points.size == 1 or (steps[0] > 0 and np.all(steps == steps[0])):
+            step = int(steps[0]) if points.size > 1 else 1
+            return slice(int(points[0]), int(points[-1]) + 1, step)
+    return points
+
+class TapFile:
+    """
+    A Helios tap file with its own header metadata, reference values, field
+    selection and memory map, so several tap files can be read at once.
+
+    The file is memory-mapped read-only when opened, so concurrent reads from
+    many threads share the page cache and never move a shared file position.
+    Field selection and reference values are replaced atomically, never
+    modified in place, so readers always see a consistent selection.
+
+    Parameters
+    ----------
+    taps_file : str
+        Path to the tap file.
+    fields : list of str, optional
+        Keys of `allfields` returned by `load_fields`.
+    ref : dict, optional
+        Reference values, see `read_refs`. Required for derived fields such as 'Pressure'.
+    stationary : bool, optional
+        Keep only the coordinates of the first timestep. Defaults to False.
+    precision : {'single', 'double'}, optional
+        Precision of the fields returned by `load_fields`. Defaults to 'double'.
+    validate : bool, optional
+        Index the file with `tap_index.index_taps` when opening it and expose only
+        the leading valid records, dropping truncated or inconsistent ones.
+        Defaults to False.
+
+    Attributes
+    ----------
+    nt, npts, nq : int
+        Number of complete records, points per record and variables per point.
+    entrysize : int
+        Size of one record in bytes.
+    """
+    __slots__ = ('taps_file', 'nt', 'npts', 'nq', 'entrysize', 'ref', 'fields', 'stationary', 'precision', 'index', '_records')
+
+    def __init__(self, taps_file, fields=("Density", "XMomentum"), ref=None, stationary=False,
+                 precision='double', validate=False):
+        self.taps_file  = taps_file
+        self.nt, self.npts, self.nq = (int(n) for n in tapinfo(taps_file))
+        self.entrysize  = tap_dtype(self.npts, self.nq).itemsize
+        self.ref        = ref
+        self.stationary = stationary
+        self.precision  = precision
+        self.fields     = ()
+        self.index      = None
+        self._records   = memmap_taps(taps_file)
+        if validate:
+            for problem in self.tap_index().problems():
+                logger.warning("%s: %s", taps_file, problem)
+            # records appended after the file was mapped are left for the next open
+            self.nt = min(self.index.nvalid, self._records.shape[0])
+        error = self.set_fields(fields)
+        if error:
+            raise ValueError(error)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Releases the memory map. Arrays already returned keep it alive until deleted."""
+        self._records = None
+
+    def set_fields(self, newfields):
+        """Selects the fields returned by `load_fields`. Returns an error string like `set_fields`."""
+        for field in newfields:
+            if not field in allfields.keys():
+                return "Did not recognize: "+str(field)
+        self.fields = tuple(newfields)
+        return ""
+
+    def setrefs(self, ref=None):
+        """Sets the reference values, reading them from inputs.py if not given."""
+        self.ref = read_refs() if ref is None else dict(ref)
+
+    def window(self, itstart=0, ntime=-1):
+        """Returns (itstart, ntime) clipped to the records of the file, as used by `records`."""
+        itstart = min(max(itstart, 0), self.nt)
+        if ntime == -1 or itstart + ntime > self.nt:
+            ntime = self.nt - itstart
+        return itstart, ntime
+
+    def records(self, itstart=0, ntime=-1):
+        """Returns a (ntime,) structured view of records, see `tap_dtype`."""
+        itstart, ntime = self.window(itstart, ntime)
+        return self._records[itstart:itstart+ntime]
+
+    def tap_index(self):
+        """Returns the `tap_index.TapIndex` of the file, building it on first use."""
+        if self.index is None:
+            from .tap_index import index_taps
+            self.index = index_taps(self.taps_file)
+        return self.index
+
+    def time_range(self, t0=-np.inf, t1=np.inf):
+        """Returns (itstart, ntime) of the records with t0 <= time <= t1 without scanning the file."""
+        itstart, ntime = self.tap_index().time_range(t0, t1)
+        return min(itstart, self.nt), max(min(ntime, self.nt - itstart), 0)
+
+    def readtaps(self, itstart=0, ntime=-1, points=None):
+        """
+        Returns (t, x, q) of a range of timesteps, see `readtaps`. `points` selects
+        a subset of tap points, see `point_selection`. Contiguous or evenly strided
+        selections are zero-copy views that only touch the selected columns.
+        """
+        records = self.records(itstart, ntime)
+        points = point_selection(points, self.npts)
+        t = records['time']
+        q = records['q'][:, points]
+        if self.stationary:
+            x = records['xyz'][0][points] if records.size > 0 else np.zeros((self.npts,3))[points]
         else:
-            x.append(xx)
-    
-    if not stationary:
-        x = np.array(x)
-    
-    q = np.array(q)
-    t = np.array(t)
-    return t,x,q
+            x = records['xyz'][:, points]
+        return t,x,q
+
+    def iter_chunks(self, chunk_size=256, itstart=0, ntime=-1, points=None):
+        """Yields (t, q) of consecutive blocks of at most `chunk_size` timesteps, for the selected points."""
+        records = self.records(itstart, ntime)
+        points = point_selection(points, self.npts)
+        for i in range(0, records.shape[0], chunk_size):
+            block = records[i:i+chunk_size]
+            yield block['time'], block['q'][:, points]
+
+    def load_fields(self, itstart=0, ntime=-1, points=None):
+        """Returns a dict of 'XYZ', 'T' and the selected fields, see `load_fields`."""
+        fields, refs = self.fields, self.ref
+        t,x,q = self.readtaps(itstart=itstart, ntime=ntime, points=points)
+        v = {"XYZ":x,"T":t}
+        # q is a view of the memory map, so the records are read while deriving
+        with span("derive", self.taps_file) as s:
+            v.update(compute_fields(q, fields, refs, dtype=precisions[self.precision]))
+            s.add(bytes_read=q.size*q.itemsize, points=q.shape[0]*q.shape[1],
+                  array=v[fields[0]] if fields else None)
+        return v
 
 def set_and_read(tapfile):
     global taps_file
@@ -92,33 +396,48 @@ def set_and_read(tapfile):
     except:
         return "could not read: "+str(tapfile) 
 
+def read_refs():
+    """
+    Reads the reference values from the referenceValues class of the inputs.py file
+    in the working directory.
+
+    Returns
+    -------
+    dict
+        Values of 'gamma', 'rgas', 'rinf', 'pinf', 'tinf', 'ainf' and 'refMach'.
+    """
+    from inputs import referenceValues
+    rv = referenceValues()
+    return {k: getattr(rv,k) for k in ['gamma','rgas','rinf','pinf','tinf','ainf','refMach']}
+
 def setrefs():
     global ref
-    ref = {}
     try:
-        from inputs import referenceValues
-        rv = referenceValues()
-        for k in ['gamma','rgas','rinf','pinf','tinf','ainf','refMach']:
-            ref[k] = getattr(rv,k)
+        ref = read_refs()
     except:
         ref = None
         quit("Could not find or read inputs.py file")
               
 def convert_to_pickle(outfile):
-    t,x,q = readtaps(taps_file)
-    v = {"XYZ":x,"T":t}
-    for field in fields:
-        v[field] = allfields[field](q)
+    v = {k: np.asarray(a) for k, a in load_fields().items()}
     with open(outfile, 'wb') as f:
         pickle.dump(v, f);
     return ""
 
+def convert_to_store(outdir, chunk_size=256, compress=False, append=False):
+    """
+    Streams the selected fields of the current tap file into a chunked columnar store
+    that can be appended to and read by window, see `tap_store.TapStore`.
+    """
+    from .tap_store import convert_to_store as _convert_to_store
+    with TapFile(taps_file, fields=fields, ref=ref, precision=precision) as taps:
+        _convert_to_store(taps, outdir, chunk_size=chunk_size, compress=compress, append=append)
+    return ""
+
 def load_fields(itstart = 0, ntime=-1):
-    t,x,q = readtaps(taps_file, itstart=itstart, ntime=ntime)
-    v = {"XYZ":x,"T":t}
-    for field in fields:
-        v[field] = allfields[field](q)
-    return v
+    logger.info("reading %s", taps_file)
+    with TapFile(taps_file, fields=fields, ref=ref, stationary=stationary, precision=precision) as taps:
+        return taps.load_fields(itstart=itstart, ntime=ntime)
 
 def set_fields(newfields):
     global fields
@@ -0,0 +1,171 @@
+"""
+Streaming temporal resampling of loading data between reading tap files and writing
+PSU-WOPWOP loading files. Each resampler is fed consecutive blocks of timesteps and
+keeps just enough samples between blocks to produce the same output as resampling the
+whole time history at once, so no separate pass over the data is needed.
+
+A resampler has two methods: `process(t, data)` takes a block of times (nt,) and data
+(nt, ...) and returns the resampled (t, data) available so far, and `flush()` returns
+whatever is left once the last block has been processed and resets the resampler, so
+the same resampler can then be fed the next time history.
+"""
+import numpy as np
+
+class UniformResampler:
+    """
+    Linearly interpolates non-uniform timesteps onto a uniform time grid.
+
+    Parameters
+    ----------
+    dt : float
+        Output time step.
+    t_start : float, optional
+        First output time. Defaults to the first input time.
+    """
+    __slots__ = ('dt', 't_start', '_t0', '_nout', '_last_t', '_last_data')
+
+    def __init__(self, dt, t_start=None):
+        if dt <= 0:
+            raise ValueError("dt must be positive")
+        self.dt        = dt
+        self.t_start   = t_start
+        self.reset()
+
+    def reset(self):
+        """Forgets the time history fed so far."""
+        self._t0        = None      # first output time of the current time history
+        self._nout      = 0
+        self._last_t    = None
+        self._last_data = None
+
+    def process(self, t, data):
+        if t.shape[0] == 0:
+            return t, data
+        if self._t0 is None:
+            self._t0 = t[0] if self.t_start is None else self.t_start
+        if self._last_t is not None:
+            # carry the last sample of the previous block as the left neighbour
+            t    = np.concatenate(([self._last_t], t))
+            data = np.concatenate((self._last_data[None], data))
+        self._last_t, self._last_data = t[-1], data[-1].copy()
+        if t.shape[0] < 2:
+            return t[:0], data[:0]
+
+        # output times t_start + k*dt that fall inside this block
+        kend = int(np.floor((t[-1] - self._t0)/self.dt + 1e-9)) + 1
+        tout = self._t0 + self.dt*np.arange(self._nout, max(kend, self._nout))
+        tout = tout[tout >= t[0] - 1e-9*self.dt]
+        self._nout = max(kend, self._nout)
+        if tout.size == 0:
+            return tout, data[:0]
+
+        i = np.clip(np.searchsorted(t, tout, side='right'), 1, t.shape[0] - 1)
+        w = (tout - t[i-1])/(t[i] - t[i-1])
+        w = np.clip(w, 0, 1).reshape((-1,) + (1,)*(data.ndim - 1))
+        out = data[i-1]*(1 - w) + data[i]*w
+        return tout, out.astype(data.dtype, copy=False)
+
+    def flush(self):
+        last_data = self._last_data
+        self.reset()
+        if last_data is None:
+            return np.zeros(0), None
+        return np.zeros(0), np.zeros((0,) + last_data.shape, dtype=last_data.dtype)
+
+def lowpass_filter(factor, ntaps=None):
+    """
+    Hamming-windowed sinc low-pass filter with a cutoff at the Nyquist frequency
+    of a signal decimated by `factor`.
+
+    Parameters
+    ----------
+    factor : int
+        Decimation factor.
+    ntaps : int, optional
+        Number of filter taps, made odd. Defaults to 8*factor + 1.
+
+    Returns
+    -------
+    numpy.ndarray
+        (ntaps,) filter weights summing to 1.
+    """
+    if ntaps is None:
+        ntaps = 8*factor + 1
+    ntaps += 1 - ntaps % 2
+    n = np.arange(ntaps) - (ntaps - 1)/2
+    weights = np.sinc(n/factor)*np.hamming(ntaps)
+    return weights/weights.sum()
+
+class Decimator:
+    """
+    Anti-aliased integer decimation: applies a zero-phase low-pass FIR filter and
+    keeps every `factor`-th timestep, starting with the first. The signal is extended
+    with its first and last samples at the ends.
+
+    Parameters
+    ----------
+    factor : int
+        Keep one timestep out of `factor`.
+    ntaps : int, optional
+        Number of filter taps, see `lowpass_filter`.
+    """
+    __slots__ = ('factor', 'weights', '_t', '_data', '_next')
+
+    def __init__(self, factor, ntaps=None):
+        if int(factor) < 1:
+            raise ValueError("factor must be a positive integer")
+        self.factor  = int(factor)
+        self.weights = lowpass_filter(self.factor, ntaps) if self.factor > 1 else np.ones(1)
+        self.reset()
+
+    def reset(self):
+        """Forgets the time history fed so far."""
+        self._t      = None     # times and data held back for the next block
+        self._data   = None
+        self._next   = 0        # position of the next output within the held samples
+
+    @property
+    def half(self):
+        return (self.weights.size - 1)//2
+
+    def _filter(self, t, data, centres):
+        out = np.zeros((centres.size,) + data.shape[1:])
+        for k, weight in enumerate(self.weights):
+            out += weight*data[centres - self.half + k]
+        return t[centres], out.astype(data.dtype, copy=False)
+
+    def process(self, t, data):
+        if t.shape[0] == 0:
+            return t, data
+        if self._t is None:
+            # pad the start with the first sample
+            t    = np.concatenate((np.full(self.half, t[0]), t))
+            data = np.concatenate((np.repeat(data[:1], self.half, axis=0), data))
+            self._next = self.half
+        else:
+            t    = np.concatenate((self._t, t))
+            data = np.concatenate((self._data, data))
+
+        # centres whose whole filter window is available
+        centres = np.arange(self._next, t.shape[0] - self.half, self.factor)
+        tout, out = self._filter(t, data, centres)
+
+        # keep the samples needed by the next centre's window
+        nxt = centres[-1] + self.factor if centres.size else self._next
+        keep = min(nxt - self.half, t.shape[0])
+        self._t, self._data = t[keep:], data[keep:].copy()
+        self._next = nxt - keep
+        return tout, out
+
+    def flush(self):
+        held_t, held_data, nxt = self._t, self._data, self._next
+        self.reset()
+        if held_t is None:
+            return np.zeros(0), None
+        if held_t.shape[0] == 0:
+            return held_t, held_data
+        # pad the end with the last sample and emit the remaining centres
+        t    = np.concatenate((held_t, np.full(self.half, held_t[-1])))
+        data = np.concatenate((held_data, np.repeat(held_data[-1:], self.half, axis=0)))
+        centres = np.arange(nxt, held_t.shape[0], self.factor)
+        return self._filter(t, data, centres)
@@ -0,0 +1,168 @@
+"""
+Uniform-grid spatial hashing of point sets. Points are binned into cubic cells twice the
+size of the matching tolerance, so every point within the tolerance of a query lies in
+one of the 8 cells nearest to it and matching is linear in the number of points.
+"""
+import numpy as np
+
+# large primes mixing the three cell indices into one hash key
+_PRIMES = np.array([73856093, 19349663, 83492791], dtype=np.int64)
+
+# which of the two nearest cells along each axis to visit, for the 8 cells around a query
+_CORNERS = np.array([(i, j, k) for i in (0, 1) for j in (0, 1) for k in (0, 1)], dtype=np.int64)
+
+def cell_index(points, cell_size, origin):
+    """Returns the (n, 3) integer cell of each point of a uniform grid."""
+    return np.floor((points - origin)/cell_size).astype(np.int64)
+
+def hash_cells(cells):
+    """Returns one int64 hash key per (n, 3) integer cell. Different cells may share a key."""
+    return np.bitwise_xor.reduce(cells*_PRIMES, axis=1)
+
+class SpatialHash:
+    """
+    Uniform-grid hash of a reference point set for fixed-radius nearest matching.
+
+    Parameters
+    ----------
+    points : numpy.ndarray
+        (n, 3) reference points.
+    cell_size : float
+        Grid cell size, at least twice the matching tolerance.
+    """
+    __slots__ = ('points', 'cell_size', 'origin', 'order', 'keys', 'max_occupancy')
+
+    def __init__(self, points, cell_size):
+        if cell_size <= 0:
+            raise ValueError("cell_size must be positive")
+        self.points    = points
+        self.cell_size = float(cell_size)
+        self.origin    = points.min(axis=0) if points.shape[0] else np.zeros(3)
+        keys = hash_cells(cell_index(points, self.cell_size, self.origin))
+        self.order = np.argsort(keys, kind='stable')
+        self.keys  = keys[self.order]
+        _, counts = np.unique(self.keys, return_counts=True)
+        self.max_occupancy = int(counts.max()) if counts.size else 0
+
+    def _candidates(self, query, tol):
+        """Yields (query indices, candidate reference indices, distances) for every candidate pair."""
+        if 2*tol > self.cell_size:
+            raise ValueError("tol must not exceed half the cell size")
+        if self.keys.size == 0 or query.shape[0] == 0:
+            return
+        position = (query - self.origin)/self.cell_size
+        cells = np.floor(position).astype(np.int64)
+        # the neighbouring cell along each axis is on the side of the cell the query is in
+        side  = np.where(position - cells < 0.5, -1, 1)
+        for corner in _CORNERS:
+            keys  = hash_cells(cells + corner*side)
+            start = np.searchsorted(self.keys, keys, side='left')
+            end   = np.searchsorted(self.keys, keys, side='right')
+            for k in range(self.max_occupancy):
+                has = np.flatnonzero(start + k < end)
+                if has.size == 0:
+                    break
+                candidate = self.order[start[has] + k]
+                yield has, candidate, np.linalg.norm(query[has] - self.points[candidate], axis=1)
+
+    def nearest(self, query, tol):
+        """
+        Finds the nearest reference point within `tol` of every query point.
+
+        Parameters
+        ----------
+        query : numpy.ndarray
+            (m, 3) query points.
+        tol : float
+            Matching distance, at most half the cell size.
+
+        Returns
+        -------
+        index : numpy.ndarray
+            (m,) index of the matched reference point, -1 where none is within `tol`.
+        distance : numpy.ndarray
+            (m,) distance to the matched point, inf where unmatched.
+        """
+        index    = np.full(query.shape[0], -1, dtype=np.int64)
+        distance = np.full(query.shape[0], np.inf)
+        for has, candidate, d in self._candidates(query, tol):
+            better = (d <= tol) & (d < distance[has])
+            index[has[better]]    = candidate[better]
+            distance[has[better]] = d[better]
+        return index, distance
+
+    def pairs(self, query, tol):
+        """
+        Finds every pair of query and reference points within `tol` of each other.
+
+        Returns
+        -------
+        iquery, ireference : numpy.ndarray
+            Indices of the query and reference point of each pair.
+        """
+        iquery, ireference = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+        for has, candidate, d in self._candidates(query, tol):
+            close = d <= tol
+            iquery.append(has[close])
+            ireference.append(candidate[close])
+        iquery, ireference = np.concatenate(iquery), np.concatenate(ireference)
+        # hash collisions can visit the same cell twice
+        unique = np.unique(np.stack((iquery, ireference)), axis=1)
+        return unique[0], unique[1]
+
+def match_points(query, reference, tol):
+    """
+    Matches every query point to the nearest reference point within `tol`.
+
+    Parameters
+    ----------
+    query : numpy.ndarray
+        (m, 3) points to match.
+    reference : numpy.ndarray
+        (n, 3) points to match against.
+    tol : float
+        Largest allowed distance.
+
+    Returns
+    -------
+    permutation : numpy.ndarray
+        (m,) index into `reference` for each query point, -1 where unmatched,
+        so `reference[permutation]` lines up with `query`.
+    unmatched : numpy.ndarray
+        Indices of the query points with no reference point within `tol`.
+    """
+    permutation, _ = SpatialHash(reference, 2*tol).nearest(query, tol)
+    return permutation, np.flatnonzero(permutation < 0)
+
+def weld_points(points, tol):
+    """
+    Merges points closer than `tol`, keeping the lowest-indexed point of each group.
+    Groups are the connected components of the points within `tol` of each other,
+    so a chain of points each within `tol` of the next becomes one point.
+
+    Parameters
+    ----------
+    points : numpy.ndarray
+        (n, 3) points.
+    tol : float
+        Welding distance.
+
+    Returns
+    -------
+    unique : numpy.ndarray
+        Indices of the kept points, in increasing order.
+    mapping : numpy.ndarray
+        (n,) index into `unique` of the point each input point was welded to.
+    """
+    i, j = SpatialHash(points, 2*tol).pairs(points, tol)
+    # propagate the lowest index through every group, jumping along chains
+    representative = np.arange(points.shape[0])
+    while True:
+        lowest = representative.copy()
+        np.minimum.at(lowest, i, representative[j])
+        lowest = lowest[lowest]
+        if np.array_equal(lowest, representative):
+            break
+        representative = lowest
+    unique, mapping = np.unique(representative, return_inverse=True)
+    return unique, mapping
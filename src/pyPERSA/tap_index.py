@@ -0,0 +1,192 @@
+"""
+Indexing of Helios tap files. The index validates the header of every record, stores
+record byte offsets and times, and flags truncated or inconsistent records so readers
+never parse garbage and can find the records of a time window without scanning the file.
+"""
+import numpy as np
+import logging
+import os
+
+from .read_taps import tap_dtype
+
+logger = logging.getLogger(__name__)
+
+# record status codes
+VALID        = 0
+TRUNCATED    = 1   # record cut short by the end of the file
+INCONSISTENT = 2   # header differs from the first record, or time is not finite
+
+_header_dtype = np.dtype([('nq', np.intc), ('npts', np.intc), ('time', np.double)])
+
+class TapIndex:
+    """
+    Byte offsets, times and status of the records of a tap file.
+
+    Parameters
+    ----------
+    npts, nq : int
+        Points and variables per record, taken from the first header.
+    offsets : numpy.ndarray
+        (n,) int64 byte offsets of every scanned record.
+    times : numpy.ndarray
+        (n,) physical times, NaN where the record is not valid.
+    status : numpy.ndarray
+        (n,) int8 status codes, see VALID, TRUNCATED and INCONSISTENT.
+    size : int
+        Size of the file in bytes when it was scanned.
+
+    Attributes
+    ----------
+    nvalid : int
+        Number of leading valid records. Only these are exposed by `time_range`.
+    entrysize : int
+        Size of one record in bytes.
+    """
+    __slots__ = ('npts', 'nq', 'offsets', 'times', 'status', 'size', 'entrysize', 'nvalid')
+
+    def __init__(self, npts, nq, offsets, times, status, size):
+        self.npts      = int(npts)
+        self.nq        = int(nq)
+        self.offsets   = offsets
+        self.times     = times
+        self.status    = status
+        self.size      = int(size)
+        self.entrysize = tap_dtype(self.npts, self.nq).itemsize
+        bad = np.flatnonzero(status != VALID)
+        self.nvalid = int(bad[0]) if bad.size else status.size
+
+    def time_range(self, t0=-np.inf, t1=np.inf):
+        """
+        Finds the valid records with t0 <= time <= t1 by binary search.
+
+        Returns
+        -------
+        itstart, ntime : int
+            First record and number of records, as taken by `readtaps`.
+        """
+        times = self.times[:self.nvalid]
+        itstart = int(np.searchsorted(times, t0, side='left'))
+        itend   = int(np.searchsorted(times, t1, side='right'))
+        return itstart, max(itend - itstart, 0)
+
+    def record_at(self, time):
+        """Returns the index of the last valid record with a time <= `time`, or -1."""
+        return int(np.searchsorted(self.times[:self.nvalid], time, side='right')) - 1
+
+    def problems(self):
+        """Returns a list of strings describing every truncated or inconsistent record."""
+        names = {TRUNCATED: "truncated", INCONSISTENT: "inconsistent"}
+        return [f"record {i} at byte {self.offsets[i]} is {names[self.status[i]]}"
+                for i in np.flatnonzero(self.status != VALID)]
+
+def _index_file(taps_file):
+    return taps_file + ".idx.npz"
+
+def _scan(taps_file, npts, nq, start=0):
+    """Scans the record headers from byte offset `start` to the end of the file."""
+    entrysize = tap_dtype(npts, nq).itemsize
+    size = os.path.getsize(taps_file)
+    ncomplete = max((size - start)//entrysize, 0)
+    offsets = start + np.arange(ncomplete, dtype=np.int64)*entrysize
+    times   = np.full(ncomplete, np.nan)
+    status  = np.full(ncomplete, VALID, dtype=np.int8)
+
+    if ncomplete > 0:
+        # one header per record, read through a strided view of the memory map
+        data = np.memmap(taps_file, dtype=np.uint8, mode='r', offset=start,
+                         shape=(ncomplete*entrysize,))
+        headers = np.ndarray((ncomplete,), dtype=_header_dtype, buffer=data, strides=(entrysize,))
+        ok = (headers['nq'] == nq) & (headers['npts'] == npts) & np.isfinite(headers['time'])
+        times[ok] = headers['time'][ok]
+        status[~ok] = INCONSISTENT
+        del headers, data
+
+    if start + ncomplete*entrysize < size:
+        offsets = np.append(offsets, start + ncomplete*entrysize)
+        times   = np.append(times, np.nan)
+        status  = np.append(status, np.int8(TRUNCATED))
+    return offsets, times, status, size
+
+def _same_last_record(taps_file, offsets, times, status, npts, nq):
+    """Checks that the last valid record of a cached index still has the same header and time."""
+    nvalid = TapIndex(npts, nq, offsets, times, status, 0).nvalid
+    if nvalid == 0:
+        return True
+    with open(taps_file, mode='rb') as f:
+        f.seek(int(offsets[nvalid-1]))
+        header = np.frombuffer(f.read(_header_dtype.itemsize), dtype=_header_dtype)
+    return header.size == 1 and header['nq'][0] == nq and header['npts'][0] == npts \
+        and header['time'][0] == times[nvalid-1]
+
+def index_taps(taps_file, use_cache=True):
+    """
+    Builds the index of a tap file, validating the header of every record.
+
+    With `use_cache`, the index is stored in a sidecar file (`taps_file + '.idx.npz'`).
+    A cached index is reused if the file is unchanged, and extended by scanning only
+    the new records if the file has grown since it was indexed and its last indexed
+    record is unchanged. Any other change causes a full rescan. Writing the sidecar is
+    best effort: if the folder is read-only the index is built without it.
+
+    Parameters
+    ----------
+    taps_file : str
+        Path to the tap file.
+    use_cache : bool, optional
+        Read and write the sidecar index. Defaults to True.
+
+    Returns
+    -------
+    TapIndex
+        The index of the file.
+    """
+    with open(taps_file, mode='rb') as f:
+        nq, npts = np.frombuffer(f.read(8), dtype=np.intc)
+
+    offsets, times, status = None, None, None
+    stat = os.stat(taps_file)
+    if use_cache and os.path.isfile(_index_file(taps_file)):
+        try:
+            with np.load(_index_file(taps_file)) as cache:
+                if cache["npts"] == npts and cache["nq"] == nq:
+                    offsets, times, status = cache["offsets"], cache["times"], cache["status"]
+                    cached_size, cached_mtime = int(cache["size"]), int(cache["mtime"])
+        except Exception:
+            offsets = None
+        if offsets is not None:
+            if cached_size == stat.st_size and cached_mtime == stat.st_mtime_ns:
+                return TapIndex(npts, nq, offsets, times, status, stat.st_size)
+            if cached_size >= stat.st_size or not _same_last_record(taps_file, offsets, times, status, npts, nq):
+                # the file was rewritten rather than appended to
+                offsets = None
+
+    if offsets is not None:
+        # the file has grown: rescan from the first record that was not complete and valid
+        nvalid = TapIndex(npts, nq, offsets, times, status, 0).nvalid
+        start = int(offsets[nvalid]) if nvalid < offsets.size else int(offsets[-1]) + tap_dtype(npts, nq).itemsize
+        new = _scan(taps_file, npts, nq, start=start)
+        offsets = np.concatenate((offsets[:nvalid], new[0]))
+        times   = np.concatenate((times[:nvalid],   new[1]))
+        status  = np.concatenate((status[:nvalid],  new[2]))
+        size = new[3]
+    else:
+        offsets, times, status, size = _scan(taps_file, npts, nq)
+
+    index = TapIndex(npts, nq, offsets, times, status, size)
+    if use_cache:
+        _write_index(taps_file, index, stat.st_mtime_ns)
+    return index
+
+def _write_index(taps_file, index, mtime):
+    """Writes the sidecar index of a tap file, skipping it if the file cannot be written."""
+    tmpfile = _index_file(taps_file) + f".{os.getpid()}.tmp.npz"
+    try:
+        np.savez(tmpfile, npts=index.npts, nq=index.nq, offsets=index.offsets, times=index.times,
+                 status=index.status, size=index.size, mtime=mtime)
+        os.replace(tmpfile, _index_file(taps_file))
+    except OSError as e:
+        logger.debug("could not write the index of %s: %s", taps_file, e)
+        try:
+            os.remove(tmpfile)
+        except OSError:
+            pass
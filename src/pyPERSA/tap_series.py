@@ -0,0 +1,238 @@
+"""
+Reading of the tap files of a restarted Helios run as one time series. Each restart
+writes a new tap file, or appends to the old one, starting from the time of the
+checkpoint it was restarted from, so the records of a surface can repeat or overlap
+in time. `TapSeries` orders the files by time, drops the superseded records and
+exposes the rest as a single strictly increasing time axis with the reading methods
+of `read_taps.TapFile`, so it can be streamed through the same conversion path.
+Records are only read when a block of them is requested.
+"""
+import numpy as np
+import logging
+
+from .read_taps import TapFile, compute_fields, point_selection, precisions
+
+logger = logging.getLogger(__name__)
+
+def kept_records(times, keep='last', tol=0.0):
+    """
+    Selects the records that make a strictly increasing time axis out of records
+    that may repeat or go back in time, e.g. after a restart.
+
+    Parameters
+    ----------
+    times : numpy.ndarray
+        (n,) times of the records in the order they were written.
+    keep : {'last', 'first'}, optional
+        'last' keeps the records written last, so a restart replaces the records
+        from its start time on. 'first' keeps the records written first and only
+        takes the records after them from a restart. Defaults to 'last'.
+    tol : float, optional
+        Times closer than `tol` are the same timestep. Defaults to 0.
+
+    Returns
+    -------
+    numpy.ndarray
+        (n,) boolean mask of the kept records.
+    """
+    times = np.asarray(times, dtype=np.float64)
+    if times.size == 0:
+        return np.zeros(0, dtype=bool)
+    if keep == 'last':
+        # a record is kept if it comes before every record written after it
+        later = np.append(np.minimum.accumulate(times[::-1])[::-1][1:], np.inf)
+        return times + tol < later
+    if keep == 'first':
+        # a record is kept if it comes after every record written before it
+        earlier = np.insert(np.maximum.accumulate(times)[:-1], 0, -np.inf)
+        return times - tol > earlier
+    raise ValueError(f"keep must be 'last' or 'first', not {keep}")
+
+class TapSeries:
+    """
+    Several tap files of one surface read as a single time series.
+
+    Files are ordered by the time of their first record and every file is validated
+    with its index, see `tap_index.index_taps`, so only the times are read when the
+    series is opened. Records repeated or overlapping in time, across files or within
+    one file, are dropped following `keep`.
+
+    Parameters
+    ----------
+    taps_files : list of str
+        Paths to the tap files, in any order.
+    fields, ref, stationary, precision
+        See `read_taps.TapFile`.
+    keep : {'last', 'first'}, optional
+        Which of the repeated records to keep, see `kept_records`. Defaults to 'last'.
+    tol : float, optional
+        Times closer than `tol` are the same timestep. Defaults to 0.
+
+    Attributes
+    ----------
+    nt, npts, nq : int
+        Number of records of the series, points per record and variables per point.
+    times : numpy.ndarray
+        (nt,) strictly increasing times of the series.
+    dropped : int
+        Number of valid records dropped as repeated.
+    """
+    __slots__ = ('taps_files', 'taps', 'nt', 'npts', 'nq', 'times', 'dropped', '_file', '_record')
+
+    def __init__(self, taps_files, fields=("Density", "XMomentum"), ref=None, stationary=False,
+                 precision='double', keep='last', tol=0.0):
+        taps = [TapFile(taps_file, fields=fields, ref=ref, stationary=stationary, precision=precision,
+                        validate=True) for taps_file in taps_files]
+        for t in taps:
+            if t.nt == 0:
+                logger.warning("%s has no valid records", t.taps_file)
+        taps = [t for t in taps if t.nt > 0]
+        if not taps:
+            raise ValueError(f"none of {list(taps_files)} has valid records")
+        for t in taps[1:]:
+            if (t.npts, t.nq) != (taps[0].npts, taps[0].nq):
+                raise ValueError(f"{t.taps_file} has {t.npts} points and {t.nq} variables, "
+                                 f"{taps[0].taps_file} has {taps[0].npts} and {taps[0].nq}")
+        times = [t.tap_index().times[:t.nt] for t in taps]
+        order = sorted(range(len(taps)), key=lambda k: times[k][0])
+        self.taps       = [taps[k] for k in order]
+        self.taps_files = [t.taps_file for t in self.taps]
+        self.npts, self.nq = taps[0].npts, taps[0].nq
+
+        file_of   = np.concatenate([np.full(t.nt, k, dtype=np.int64) for k, t in enumerate(self.taps)])
+        record_of = np.concatenate([np.arange(t.nt, dtype=np.int64) for t in self.taps])
+        all_times = np.concatenate([times[k] for k in order])
+        kept = kept_records(all_times, keep=keep, tol=tol)
+        self._file, self._record, self.times = file_of[kept], record_of[kept], all_times[kept]
+        self.nt = int(kept.sum())
+        self.dropped = int(kept.size - self.nt)
+        if self.dropped:
+            logger.info("dropped %d repeated records of %d tap files, keeping %d", self.dropped,
+                        len(self.taps), self.nt)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Releases the memory maps of every file."""
+        for t in self.taps:
+            t.close()
+
+    @property
+    def fields(self):
+        return self.taps[0].fields
+
+    @property
+    def ref(self):
+        return self.taps[0].ref
+
+    @property
+    def precision(self):
+        return self.taps[0].precision
+
+    @property
+    def stationary(self):
+        return self.taps[0].stationary
+
+    def set_fields(self, newfields):
+        """Selects the fields returned by `load_fields`, see `read_taps.TapFile.set_fields`."""
+        for t in self.taps:
+            error = t.set_fields(newfields)
+            if error:
+                return error
+        return ""
+
+    def setrefs(self, ref=None):
+        """Sets the reference values of every file, see `read_taps.TapFile.setrefs`."""
+        for t in self.taps:
+            t.setrefs(ref)
+
+    def window(self, itstart=0, ntime=-1):
+        """Returns (itstart, ntime) clipped to the records of the series."""
+        itstart = min(max(itstart, 0), self.nt)
+        if ntime == -1 or itstart + ntime > self.nt:
+            ntime = self.nt - itstart
+        return itstart, ntime
+
+    def _runs(self, itstart, ntime):
+        """Yields (file, first record, number of records) of the consecutive records of a window."""
+        files   = self._file[itstart:itstart+ntime]
+        records = self._record[itstart:itstart+ntime]
+        breaks = np.flatnonzero((np.diff(files) != 0) | (np.diff(records) != 1)) + 1
+        for start, end in zip(np.append(0, breaks), np.append(breaks, files.size)):
+            if end > start:
+                yield int(files[start]), int(records[start]), int(end - start)
+
+    def records(self, itstart=0, ntime=-1):
+        """
+        Returns a (ntime,) structured array of records, see `read_taps.tap_dtype`. A view
+        of the memory map if the records are consecutive in one file, otherwise a copy,
+        so long windows should be read with `iter_chunks`.
+        """
+        itstart, ntime = self.window(itstart, ntime)
+        blocks = [self.taps[k].records(r, n) for k, r, n in self._runs(itstart, ntime)]
+        if len(blocks) == 1:
+            return blocks[0]
+        if not blocks:
+            return self.taps[0].records(0, 0)
+        return np.concatenate(blocks)
+
+    def time_range(self, t0=-np.inf, t1=np.inf):
+        """Returns (itstart, ntime) of the records with t0 <= time <= t1."""
+        itstart = int(np.searchsorted(self.times, t0, side='left'))
+        itend   = int(np.searchsorted(self.times, t1, side='right'))
+        return itstart, max(itend - itstart, 0)
+
+    def readtaps(self, itstart=0, ntime=-1, points=None):
+        """Returns (t, x, q) of a range of timesteps, see `read_taps.TapFile.readtaps`."""
+        records = self.records(itstart, ntime)
+        points = point_selection(points, self.npts)
+        t = records['time']
+        q = records['q'][:, points]
+        if self.stationary:
+            x = records['xyz'][0][points] if records.size > 0 else np.zeros((self.npts,3))[points]
+        else:
+            x = records['xyz'][:, points]
+        return t,x,q
+
+    def iter_chunks(self, chunk_size=256, itstart=0, ntime=-1, points=None):
+        """
+        Yields (t, q) of consecutive blocks of at most `chunk_size` timesteps, for the
+        selected points. Blocks within one file are views of its memory map, blocks
+        spanning a restart are gathered from both files.
+        """
+        itstart, ntime = self.window(itstart, ntime)
+        points = point_selection(points, self.npts)
+        for i in range(itstart, itstart + ntime, chunk_size):
+            runs = [self.taps[k].records(r, n) for k, r, n in self._runs(i, min(chunk_size, itstart + ntime - i))]
+            if len(runs) == 1:
+                yield runs[0]['time'], runs[0]['q'][:, points]
+            else:
+                yield (np.concatenate([run['time'] for run in runs]),
+                       np.concatenate([run['q'][:, points] for run in runs]))
+
+    def load_fields(self, itstart=0, ntime=-1, points=None):
+        """Returns a dict of 'XYZ', 'T' and the selected fields, see `read_taps.load_fields`."""
+        t,x,q = self.readtaps(itstart=itstart, ntime=ntime, points=points)
+        v = {"XYZ":x,"T":t}
+        v.update(compute_fields(q, self.fields, self.ref, dtype=precisions[self.precision]))
+        return v
+
+def open_taps(taps_files, **kwargs):
+    """
+    Opens one tap file as a `read_taps.TapFile` with validation, or a list of the
+    tap files of a restarted run as a `TapSeries`.
+
+    Parameters
+    ----------
+    taps_files : str or list of str
+        Path to a tap file, or paths to the tap files of one surface.
+    **kwargs
+        Passed to `TapFile` or `TapSeries`, e.g. fields, ref, precision.
+    """
+    if isinstance(taps_files, (list, tuple)):
+        return TapSeries(taps_files, **kwargs)
+    return TapFile(taps_files, validate=True, **kwargs)
@@ -0,0 +1,236 @@
+"""
+A chunked columnar on-disk store for tap data, replacing whole-run pickles. Each field is
+kept in its own file of (nt, npts) rows, appended chunk by chunk, next to a JSON manifest
+holding the time axis, reference values and chunk layout. Uncompressed fields are memory
+mapped, so any window of timesteps and points is read without loading the rest;
+zlib-compressed fields only decompress the chunks overlapping the window.
+
+Layout of a store directory::
+
+    manifest.json       npts, fields, precision, refs, chunks and file sizes
+    T.f64               float64 times, one per timestep
+    XYZ.npy             (npts, 3) coordinates of the first timestep
+    <field>.bin         raw rows, or concatenated zlib blocks when compressed
+"""
+import numpy as np
+import json
+import os
+import zlib
+
+from .read_taps import compute_fields, point_selection, precisions
+
+class TapStore:
+    """
+    An open tap store. Use `TapStore.create` to start a new store.
+
+    Parameters
+    ----------
+    store_dir : str
+        Directory of an existing store.
+    """
+    __slots__ = ('store_dir', 'manifest')
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, "manifest.json")) as f:
+            self.manifest = json.load(f)
+
+    @classmethod
+    def create(cls, store_dir, npts, fields, xyz=None, refs=None, precision='double', compress=False):
+        """
+        Creates an empty store, replacing any store in `store_dir`.
+
+        Parameters
+        ----------
+        store_dir : str
+            Directory of the store, created if needed.
+        npts : int
+            Number of points per timestep.
+        fields : list of str
+            Names of the stored fields.
+        xyz : numpy.ndarray, optional
+            (npts, 3) coordinates of the points.
+        refs : dict, optional
+            Reference values saved with the data.
+        precision : {'single', 'double'}, optional
+            Precision of the stored fields. Defaults to 'double'.
+        compress : bool, optional
+            Compress every chunk of every field with zlib. Defaults to False.
+        """
+        os.makedirs(store_dir, exist_ok=True)
+        if refs is not None:
+            refs = {k: float(v) for k, v in refs.items()}
+        manifest = {"npts": int(npts), "fields": list(fields), "precision": precision,
+                    "compress": bool(compress), "refs": refs, "nt": 0, "chunks": [],
+                    "sizes": {field: 0 for field in list(fields) + ["T"]}}
+        for field in list(fields) + ["T"]:
+            open(cls._path(store_dir, field), 'wb').close()
+        if xyz is not None:
+            np.save(os.path.join(store_dir, "XYZ.npy"), xyz)
+        cls._write_manifest(store_dir, manifest)
+        return cls(store_dir)
+
+    @staticmethod
+    def _path(store_dir, field):
+        return os.path.join(store_dir, "T.f64" if field == "T" else field + ".bin")
+
+    @staticmethod
+    def _write_manifest(store_dir, manifest):
+        tmpfile = os.path.join(store_dir, "manifest.json.tmp")
+        with open(tmpfile, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmpfile, os.path.join(store_dir, "manifest.json"))
+
+    @property
+    def nt(self):
+        return self.manifest["nt"]
+
+    @property
+    def npts(self):
+        return self.manifest["npts"]
+
+    @property
+    def fields(self):
+        return self.manifest["fields"]
+
+    @property
+    def dtype(self):
+        return np.dtype(precisions[self.manifest["precision"]])
+
+    def append(self, t, values):
+        """
+        Appends a chunk of timesteps. The manifest is only updated once every file is
+        written, so an interrupted append leaves the store as it was.
+
+        Parameters
+        ----------
+        t : array_like
+            (nt,) times of the chunk.
+        values : dict
+            (nt, npts) array of every stored field.
+        """
+        t = np.asarray(t, dtype=np.float64)
+        manifest = self.manifest
+        chunk = {"nt": int(t.shape[0]), "offsets": {}, "nbytes": {}}
+        for field in self.fields + ["T"]:
+            data = t if field == "T" else np.ascontiguousarray(values[field], dtype=self.dtype)
+            if field != "T" and data.shape != (t.shape[0], self.npts):
+                raise ValueError(f"{field} has shape {data.shape}, expected {(t.shape[0], self.npts)}")
+            raw = data.tobytes()
+            if manifest["compress"] and field != "T":
+                raw = zlib.compress(raw)
+            with open(self._path(self.store_dir, field), 'r+b') as f:
+                # drop anything written by an interrupted append
+                f.truncate(manifest["sizes"][field])
+                f.seek(manifest["sizes"][field])
+                f.write(raw)
+            chunk["offsets"][field] = manifest["sizes"][field]
+            chunk["nbytes"][field] = len(raw)
+
+        for field in self.fields + ["T"]:
+            manifest["sizes"][field] += chunk["nbytes"][field]
+        manifest["chunks"].append(chunk)
+        manifest["nt"] += chunk["nt"]
+        self._write_manifest(self.store_dir, manifest)
+
+    def times(self):
+        """Returns the (nt,) time axis."""
+        return np.fromfile(self._path(self.store_dir, "T"), dtype=np.float64,
+                           count=self.nt)
+
+    def xyz(self):
+        """Returns the (npts, 3) coordinates, or None if none were stored."""
+        path = os.path.join(self.store_dir, "XYZ.npy")
+        return np.load(path, mmap_mode='r') if os.path.isfile(path) else None
+
+    def read(self, field, itstart=0, ntime=-1, points=None):
+        """
+        Reads a window of a field.
+
+        Parameters
+        ----------
+        field : str
+            Name of the field.
+        itstart : int, optional
+            First timestep. Defaults to 0.
+        ntime : int, optional
+            Number of timesteps, -1 reads to the end.
+        points : optional
+            Point selection, see `read_taps.point_selection`.
+
+        Returns
+        -------
+        numpy.ndarray
+            (ntime, npoints) array. A view of the memory map for uncompressed stores.
+        """
+        itstart = min(max(itstart, 0), self.nt)
+        if ntime == -1 or itstart + ntime > self.nt:
+            ntime = self.nt - itstart
+        points = point_selection(points, self.npts)
+        if ntime == 0:
+            return np.zeros((0, self.npts), dtype=self.dtype)[:, points]
+
+        path = self._path(self.store_dir, field)
+        if not self.manifest["compress"]:
+            data = np.memmap(path, dtype=self.dtype, mode='r', shape=(self.nt, self.npts))
+            return data[itstart:itstart+ntime, points]
+
+        blocks = []
+        chunk_start = 0
+        with open(path, 'rb') as f:
+            for chunk in self.manifest["chunks"]:
+                chunk_end = chunk_start + chunk["nt"]
+                if chunk_end > itstart and chunk_start < itstart + ntime:
+                    f.seek(chunk["offsets"][field])
+                    raw = zlib.decompress(f.read(chunk["nbytes"][field]))
+                    data = np.frombuffer(raw, dtype=self.dtype).reshape(chunk["nt"], self.npts)
+                    blocks.append(data[max(itstart - chunk_start, 0):itstart + ntime - chunk_start, points])
+                chunk_start = chunk_end
+        return np.concatenate(blocks)
+
+    def load_fields(self, itstart=0, ntime=-1, points=None):
+        """Returns a dict of 'XYZ', 'T' and every field for a window, like `read_taps.load_fields`."""
+        itstart = min(max(itstart, 0), self.nt)
+        ntime = self.nt - itstart if ntime == -1 or itstart + ntime > self.nt else ntime
+        xyz = self.xyz()
+        v = {"XYZ": None if xyz is None else xyz[point_selection(points, self.npts)],
+             "T": self.times()[itstart:itstart+ntime]}
+        for field in self.fields:
+            v[field] = self.read(field, itstart, ntime, points)
+        return v
+
+def convert_to_store(taps, store_dir, chunk_size=256, compress=False, append=False):
+    """
+    Streams a tap file into a tap store, deriving the fields selected on the `TapFile`.
+
+    Parameters
+    ----------
+    taps : read_taps.TapFile
+        Open tap file with the fields, reference values and precision to store.
+    store_dir : str
+        Directory of the store.
+    chunk_size : int, optional
+        Timesteps per chunk. Defaults to 256.
+    compress : bool, optional
+        Compress chunks with zlib. Defaults to False. Ignored when appending.
+    append : bool, optional
+        Append only the timesteps after those already in an existing store,
+        e.g. records Helios wrote since the last call. Defaults to False.
+
+    Returns
+    -------
+    TapStore
+        The store.
+    """
+    if append and os.path.isfile(os.path.join(store_dir, "manifest.json")):
+        store = TapStore(store_dir)
+        if store.fields != list(taps.fields) or store.npts != taps.npts:
+            raise ValueError(f"{store_dir} holds different fields or points than {taps.taps_file}")
+    else:
+        xyz = np.asarray(taps.records(0, 1)['xyz'][0]) if taps.nt > 0 else None
+        store = TapStore.create(store_dir, taps.npts, taps.fields, xyz=xyz, refs=taps.ref,
+                                precision=taps.precision, compress=compress)
+
+    for t, q in taps.iter_chunks(chunk_size=chunk_size, itstart=store.nt):
+        store.append(t, compute_fields(q, taps.fields, taps.ref, dtype=store.dtype))
+    return store
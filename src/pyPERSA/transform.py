@@ -0,0 +1,209 @@
+"""
+Rigid-body transforms of surface coordinates and normals. Rotations, translations and
+uniform scaling are composed into one 4x4 homogeneous matrix, which is then applied to
+coordinates and normals in place in a single blocked pass, so a sequence of frame
+changes and unit conversions costs one pass over the arrays and no full-size copies.
+"""
+import numpy as np
+
+# rows transformed at once, keeping the float64 scratch block small
+_block_rows = 65536
+
+def _axis_vector(axis):
+    if isinstance(axis, str):
+        axes = {'x': (1, 0, 0), 'y': (0, 1, 0), 'z': (0, 0, 1)}
+        if axis not in axes:
+            raise ValueError(f"not valid axis: {axis}")
+        return np.array(axes[axis], dtype=np.float64)
+    axis = np.asarray(axis, dtype=np.float64)
+    norm = np.linalg.norm(axis)
+    if axis.shape != (3,) or norm == 0:
+        raise ValueError("axis must be 'x', 'y', 'z' or a non-zero 3-vector")
+    return axis/norm
+
+class Transform:
+    """
+    An affine transform of 3D space stored as a 4x4 homogeneous matrix. Transforms are
+    immutable; composing methods return a new transform applied after this one, e.g.
+
+    >>> t = Transform.rotation('z', 90).translate((1, 0, 0)).scale(0.0254)
+
+    rotates, then translates, then converts inches to meters.
+
+    Parameters
+    ----------
+    matrix : array_like, optional
+        (4, 4) homogeneous matrix, or (3, 3) linear part. Defaults to the identity.
+    """
+    __slots__ = ('matrix',)
+
+    def __init__(self, matrix=None):
+        m = np.eye(4)
+        if matrix is not None:
+            matrix = np.asarray(matrix, dtype=np.float64)
+            if matrix.shape == (3, 3):
+                m[:3, :3] = matrix
+            elif matrix.shape == (4, 4):
+                m[...] = matrix
+            else:
+                raise ValueError(f"matrix must be 3x3 or 4x4, not {matrix.shape}")
+        self.matrix = m
+
+    @classmethod
+    def rotation(cls, axis, angle, degrees=True):
+        """
+        Rotation by `angle` about `axis` through the origin, right-handed.
+
+        Parameters
+        ----------
+        axis : {'x', 'y', 'z'} or array_like
+            Coordinate axis or any (3,) direction.
+        angle : float
+            Rotation angle.
+        degrees : bool, optional
+            `angle` is in degrees rather than radians. Defaults to True.
+        """
+        k = _axis_vector(axis)
+        theta = np.deg2rad(angle) if degrees else float(angle)
+        K = np.array([[0, -k[2], k[1]],
+                      [k[2], 0, -k[0]],
+                      [-k[1], k[0], 0]])
+        # Rodrigues' rotation formula
+        return cls(np.eye(3) + np.sin(theta)*K + (1 - np.cos(theta))*(K @ K))
+
+    @classmethod
+    def quaternion(cls, q):
+        """Rotation given by a quaternion (w, x, y, z), normalized first."""
+        q = np.asarray(q, dtype=np.float64)
+        norm = np.linalg.norm(q)
+        if q.shape != (4,) or norm == 0:
+            raise ValueError("quaternion must be a non-zero (w, x, y, z)")
+        w, x, y, z = q/norm
+        return cls(np.array([[1 - 2*(y*y + z*z), 2*(x*y - w*z),     2*(x*z + w*y)],
+                             [2*(x*y + w*z),     1 - 2*(x*x + z*z), 2*(y*z - w*x)],
+                             [2*(x*z - w*y),     2*(y*z + w*x),     1 - 2*(x*x + y*y)]]))
+
+    @classmethod
+    def translation(cls, offset):
+        """Translation by a (3,) offset."""
+        m = np.eye(4)
+        m[:3, 3] = offset
+        return cls(m)
+
+    @classmethod
+    def scaling(cls, factor):
+        """Uniform scaling by `factor` about the origin, e.g. 0.0254 for inches to meters."""
+        if np.ndim(factor) != 0 or factor == 0:
+            raise ValueError("only non-zero uniform scaling is supported")
+        return cls(np.eye(3)*float(factor))
+
+    def then(self, other):
+        """Returns the transform applying this one, then `other`."""
+        other = other if isinstance(other, Transform) else Transform(other)
+        return Transform(other.matrix @ self.matrix)
+
+    def rotate(self, axis, angle, degrees=True):
+        """Returns this transform followed by a rotation, see `rotation`."""
+        return self.then(Transform.rotation(axis, angle, degrees))
+
+    def rotate_quaternion(self, q):
+        """Returns this transform followed by a rotation, see `quaternion`."""
+        return self.then(Transform.quaternion(q))
+
+    def translate(self, offset):
+        """Returns this transform followed by a translation, see `translation`."""
+        return self.then(Transform.translation(offset))
+
+    def scale(self, factor):
+        """Returns this transform followed by a uniform scaling, see `scaling`."""
+        return self.then(Transform.scaling(factor))
+
+    def inverse(self):
+        """Returns the inverse transform."""
+        return Transform(np.linalg.inv(self.matrix))
+
+    def normal_matrix(self):
+        """
+        Returns the (3, 3) matrix transforming normals: the cofactor matrix of the linear
+        part. Normals keep their direction relative to the surface, and area-weighted
+        normals such as those of `facet_reader.vertex_normals` scale with the area.
+        """
+        linear = self.matrix[:3, :3]
+        return np.linalg.det(linear)*np.linalg.inv(linear).T
+
+    def apply(self, coordinates, normals=None):
+        """
+        Transforms coordinates, and optionally normals, in place.
+
+        Rows are transformed in blocks through a small float64 scratch array, so no
+        copy of the full arrays is made whatever their size or dtype.
+
+        Parameters
+        ----------
+        coordinates : numpy.ndarray
+            (n, 3) writable floating point array of points.
+        normals : numpy.ndarray, optional
+            (n, 3) writable floating point array of normals. Translations do not
+            apply to normals.
+
+        Returns
+        -------
+        numpy.ndarray or tuple of numpy.ndarray
+            `coordinates`, or (`coordinates`, `normals`) if normals were given.
+        """
+        linear, offset = self.matrix[:3, :3].T, self.matrix[:3, 3]
+        _apply_linear(coordinates, linear, offset)
+        if normals is None:
+            return coordinates
+        _apply_linear(normals, self.normal_matrix().T, None)
+        return coordinates, normals
+
+    def __matmul__(self, other):
+        """`a @ b` applies `b` first, then `a`, like the matrices."""
+        return other.then(self) if isinstance(other, Transform) else NotImplemented
+
+    def __repr__(self):
+        return f"Transform({self.matrix.tolist()})"
+
+def _apply_linear(array, linear_t, offset):
+    """Replaces the rows of an (n, 3) array by `row @ linear_t + offset`, block by block."""
+    if array.ndim != 2 or array.shape[1] != 3:
+        raise ValueError(f"expected an (n, 3) array, not {array.shape}")
+    if not np.issubdtype(array.dtype, np.floating):
+        raise TypeError(f"cannot transform an array of {array.dtype} in place")
+    scratch = np.empty((min(_block_rows, array.shape[0]), 3))
+    for start in range(0, array.shape[0], _block_rows):
+        block = array[start:start+_block_rows]
+        out = scratch[:block.shape[0]]
+        np.matmul(block, linear_t, out=out)
+        if offset is not None:
+            out += offset
+        block[...] = out
+
+def compose(*transforms):
+    """Returns the transform applying `transforms` in order, each a `Transform` or a matrix."""
+    result = Transform()
+    for transform in transforms:
+        result = result.then(transform)
+    return result
+
+def transform_facets(transform, facets):
+    """
+    Applies one transform in place to the coordinates and normals of several surfaces.
+
+    Parameters
+    ----------
+    transform : Transform
+        The transform, e.g. `compose` of the frame change and unit conversion.
+    facets : list of tuple
+        (coordinates, normals, tri_connectivity, quad_connectivity) of each surface,
+        as returned by `facet_reader.process_facet`. Connectivity is unchanged.
+
+    Returns
+    -------
+    list of tuple
+        `facets`, with their arrays transformed in place.
+    """
+    for coordinates, normals, *_ in facets:
+        transform.apply(coordinates, normals)
+    return facets
@@ -3,11 +3,17 @@ Functions that write text files in the correct format for Helios extracts module
 tap_extracts.py file necessary for the extracts module to work.
 """
 import numpy as np
+import logging
 import os
 
-def write_extract_points(Coordinates, tap_write_dir = 'Taps', tapname="Tap"):        
+from .instrument import span
+from .transform import Transform
+
+logger = logging.getLogger(__name__)
+
+def write_extract_points(Coordinates, tap_write_dir = 'Taps', tapname="Tap", binary=False):        
     """
-    Writes an array of coordinates to a text file formatted for Helios extracts module
+    Writes an array of coordinates to a file formatted for Helios extracts module
 
     Parameters
     ----------
@@ -17,16 +23,29 @@ def write_extract_points(Coordinates, tap_write_dir = 'Taps', tapname="Tap"):
         The directory path where the file will be saved. Defaults to 'Taps'.
     tapname : str, optional
         The base name of the file (without extension). Defaults to "Tap".
+    binary : bool, optional
+        Write a float64 .npy file instead of a text file. Binary files keep full
+        precision and are loaded by the generated tap_extracts.py in a single
+        numpy.load call. Defaults to False.
+
+    Returns
+    -------
+    str
+        Name of the file written (with extension), as passed to `write_extracts_py`.
     """
     os.makedirs(tap_write_dir, exist_ok=True)
-    tapfilestring = f"{tap_write_dir}/{tapname}.txt"
+    tapfilename = f"{tapname}.npy" if binary else f"{tapname}.txt"
+    tapfilestring = f"{tap_write_dir}/{tapfilename}"
 
-    print(Coordinates.shape)
-    
-    np.savetxt(tapfilestring, Coordinates, fmt='%.7f', delimiter=' ')
+    with span("write", tapfilestring) as s:
+        if binary:
+            np.save(tapfilestring, np.ascontiguousarray(Coordinates, dtype=np.float64))
+        else:
+            np.savetxt(tapfilestring, Coordinates, fmt='%.7f', delimiter=' ')
+        s.add(bytes_written=os.path.getsize(tapfilestring), points=len(Coordinates))
 
-    print("-----------------------------------------------------")
-    print(f"wrote {tapname} to {tap_write_dir}")
+    logger.info("wrote %d points of %s to %s", len(Coordinates), tapname, tap_write_dir)
+    return tapfilename
             
 def write_extracts_py(tapnames, reference="frameID=1", frequency=1):
     """
@@ -37,6 +56,7 @@ def write_extracts_py(tapnames, reference="frameID=1", frequency=1):
     ----------
     tapnames : list of str
         A list of filenames corresponding to the tap files stored in the 'extracts/' directory.
+        Files ending in '.npy' are loaded with numpy.load, any other file is parsed as text.
     reference : str
         String of "frameID=N" or "bodyID=N" coordinate frame to attach taps to. Try adding a tap manually
         in higen, exporting inputs, and looking at the new tap_extracts.py to know this value.
@@ -46,6 +66,8 @@ def write_extracts_py(tapnames, reference="frameID=1", frequency=1):
     ntapfiles = len(tapnames)
     with open('tap_extracts.py', 'w') as f:
 
+        if any(tapname.endswith('.npy') for tapname in tapnames):
+            f.write('import numpy\n')
         f.write('class tap_extracts:\n')
         f.write('    nslices=0\n')
         f.write(f'    ntaps={ntapfiles}\n')
@@ -54,16 +76,20 @@ def write_extracts_py(tapnames, reference="frameID=1", frequency=1):
             f.write(f'    class tap{i}:\n')
             f.write(f'        frequency={frequency}\n')
             
-            f.write(f"        x = [[float(a) for a in b.split()] for b in open('extracts/{tapnames[i]}').readlines()]\n")
+            if tapnames[i].endswith('.npy'):
+                f.write(f"        x = numpy.load('extracts/{tapnames[i]}').tolist()\n")
+            else:
+                f.write(f"        x = [[float(a) for a in b.split()] for b in open('extracts/{tapnames[i]}').readlines()]\n")
             f.write('        ' + reference + '\n')
         
-        print("-----------------------------------------------------")
-        print(f"wrote tap_extracts.py file for {ntapfiles} tap files")
+    logger.info("wrote tap_extracts.py file for %d tap files", ntapfiles)
         
 def rotate(Coordinates, axis, angle=-90):
     """
     Rotates a set of 3D coordinates around a primary axis (x, y, or z). This may be useful
     if taps are defined in a different coordinate frame than desired out of Helios.
+    Use `transform.Transform` to compose several rotations, translations and scaling
+    and to transform normals as well.
 
     Parameters
     ----------
@@ -77,27 +103,12 @@ def rotate(Coordinates, axis, angle=-90):
     Returns
     -------
     numpy.ndarray or None
-        An (N, 3) array of rotated coordinates.
+        An (N, 3) array of rotated coordinates, or None if `axis` is not valid.
     """
-    radians = np.deg2rad(angle)
-    
-    if axis == 'x':
-        R_x = np.array([[1, 0, 0],
-                    [0, np.cos(radians), -np.sin(radians)],
-                    [0, np.sin(radians), np.cos(radians)]])
-    elif axis == 'y':
-        R_x = np.array([[np.cos(radians), 0, np.sin(radians)],
-                    [0, 1, 0],
-                    [-np.sin(radians), 0, np.cos(radians)]])
-                        
-    elif axis == 'z':
-        R_x = np.array([[np.cos(radians), -np.sin(radians), 0],
-                    [np.sin(radians), np.cos(radians), 0],
-                    [0, 0, 1]])
-        
-    else:
-        print('not valid axis')
+    if axis not in ('x', 'y', 'z'):
+        logger.error("not valid axis: %s", axis)
         return
-    
-    print(f"rotated {angle} degrees about {axis}")
-    return np.dot(xyz, R_x.T)
+
+    rotated = Transform.rotation(axis, angle).apply(np.array(Coordinates, dtype=np.float64))
+    logger.info("rotated %s degrees about %s", angle, axis)
+    return rotated
@@ -0,0 +1,162 @@
+"""
+Functions that write PSU-WOPWOP functional data (loading) files incrementally, one block of
+timesteps at a time, so the full loading history never has to be held in memory.
+Aperiodic and periodic files are supported.
+Only single-zone, unstructured, node-centered files are written, matching the permeable
+surfaces produced by pyPERSA.
+"""
+import numpy as np
+
+from .instrument import span
+
+MAGIC_NUMBER = 42
+COMMENT_LENGTH = 1024
+NAME_LENGTH = 32
+
+time_types = {'constant': 1, 'periodic': 2, 'aperiodic': 3}
+data_types = {'surf_pressure': 1, 'surf_loading_vector': 2, 'flow_params': 3}
+ref_frames = {'ground_fixed': 1, 'rotating_ground_fixed': 2, 'patch_fixed': 3}
+float_types = {'single': np.float32, 'double': np.float64}
+
+def _write_string(f, string, length):
+    f.write(string.encode('ascii')[:length].ljust(length, b' '))
+
+def _write_ints(f, *values):
+    f.write(np.array(values, dtype='<i4').tobytes())
+
+def write_loading_header(f, name, nt, npts, nfaces, comment='Unstructured file - loading',
+                         float_type='single', loading_data_type='flow_params',
+                         loading_ref_frame='ground_fixed', loading_time_type='aperiodic', period=None):
+    """
+    Writes the header of a single-zone aperiodic or periodic unstructured loading file.
+
+    Parameters
+    ----------
+    f : file object
+        Binary file opened for writing, positioned at the start of the file.
+    name : str
+        Zone name, truncated to 32 characters.
+    nt : int
+        Number of timesteps that will follow the header, nKey for periodic files.
+    npts : int
+        Number of nodes in the zone.
+    nfaces : int
+        Number of faces in the zone.
+    comment : str, optional
+        File comment, truncated to 1024 characters.
+    float_type : {'single', 'double'}, optional
+        Precision of the data that will follow. Defaults to 'single'.
+    loading_data_type : str, optional
+        Key of `data_types`. Defaults to 'flow_params' for permeable surfaces.
+    loading_ref_frame : str, optional
+        Key of `ref_frames`. Defaults to 'ground_fixed'.
+    loading_time_type : {'aperiodic', 'periodic'}, optional
+        Defaults to 'aperiodic'.
+    period : float, optional
+        Period of the data, required for periodic files.
+
+    Returns
+    -------
+    int
+        Byte offset of the nT entry in the zone header, which can be rewritten
+        with `update_loading_nt` once the final number of timesteps is known.
+    """
+    _write_ints(f, MAGIC_NUMBER, 1, 0)
+    _write_string(f, comment, COMMENT_LENGTH)
+    _write_ints(f, 2,                                   # functional data file
+                   1,                                   # number of zones
+                   2,                                   # unstructured
+                   time_types[loading_time_type],
+                   1,                                   # node centered
+                   data_types[loading_data_type],
+                   ref_frames[loading_ref_frame],
+                   1 if float_type == 'single' else 2,
+                   0,                                   # no iblank
+                   0)                                   # reserved
+    _write_ints(f, 1, 1)                                # one zone with data: zone 1
+    _write_string(f, name, NAME_LENGTH)
+    if loading_time_type == 'periodic':
+        f.write(np.array([period], dtype=np.dtype(float_types[float_type]).newbyteorder('<')).tobytes())
+    nt_offset = f.tell()
+    _write_ints(f, nt, npts, nfaces)
+    return nt_offset
+
+def update_loading_nt(f, nt_offset, nt):
+    """
+    Rewrites the number of timesteps stored in a loading file header in place.
+
+    Parameters
+    ----------
+    f : file object
+        Binary file opened for writing.
+    nt_offset : int
+        Offset returned by `write_loading_header`.
+    nt : int
+        New number of timesteps.
+    """
+    position = f.tell()
+    f.seek(nt_offset)
+    _write_ints(f, nt)
+    f.seek(position)
+
+def read_loading_header(loading_file):
+    """
+    Reads the header of a single-zone unstructured loading file written by
+    `write_loading_header`, without reading its data.
+
+    Parameters
+    ----------
+    loading_file : str
+        Path to the loading file.
+
+    Returns
+    -------
+    dict
+        'name', 'nt' (nKey for periodic files), 'npts', 'nfaces', 'time_type',
+        'float_type' and 'period' (None for aperiodic files).
+    """
+    time_names = {v: k for k, v in time_types.items()}
+    with open(loading_file, 'rb') as f:
+        magic, = np.frombuffer(f.read(4), dtype='<i4')
+        if magic != MAGIC_NUMBER:
+            raise ValueError(f"{loading_file} is not a little-endian PSU-WOPWOP file")
+        f.seek(3*4 + COMMENT_LENGTH)
+        header = np.frombuffer(f.read(10*4), dtype='<i4')
+        f.seek(2*4, 1)
+        name = f.read(NAME_LENGTH).decode('ascii', errors='replace').strip()
+        time_type  = time_names[int(header[3])]
+        float_type = 'single' if header[7] == 1 else 'double'
+        period = None
+        if time_type == 'periodic':
+            period = float(np.frombuffer(f.read(np.dtype(float_types[float_type]).itemsize),
+                                         dtype=np.dtype(float_types[float_type]).newbyteorder('<'))[0])
+        nt, npts, nfaces = (int(n) for n in np.frombuffer(f.read(3*4), dtype='<i4'))
+    return {"name": name, "nt": nt, "npts": npts, "nfaces": nfaces, "time_type": time_type,
+            "float_type": float_type, "period": period}
+
+def append_loading_data(f, t, loading_data, float_type='single'):
+    """
+    Appends a block of timesteps to an aperiodic or periodic loading file.
+
+    Parameters
+    ----------
+    f : file object
+        Binary file opened for writing, positioned after the last written timestep.
+    t : array_like
+        A (nt,) array of times for the block.
+    loading_data : numpy.ndarray
+        A (nt, nvars, npts) array of loading data, e.g. nvars = 5 for flow_params
+        (density, x/y/z momentum, pressure).
+    float_type : {'single', 'double'}, optional
+        Precision written to disk. Defaults to 'single'.
+    """
+    dtype = np.dtype(float_types[float_type]).newbyteorder('<')
+    times = np.asarray(t, dtype=dtype)
+    with span("write", getattr(f, 'name', '')) as s:
+        # data already in the output dtype is written straight from its buffer,
+        # anything else is cast one timestep at a time
+        for i in range(loading_data.shape[0]):
+            f.write(times[i:i+1].tobytes())
+            f.write(np.ascontiguousarray(loading_data[i], dtype=dtype).data)
+        s.add(bytes_written=loading_data.shape[0]*(1 + loading_data[0].size)*dtype.itemsize,
+              points=loading_data.shape[0]*loading_data.shape[-1])
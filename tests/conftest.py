@@ -0,0 +1,17 @@
+import numpy as np
+import pytest
+
+from pyPERSA.read_taps import tap_dtype
+
+def _tap_records(nt, npts=6, t0=0.0, dt=0.1, seed=0):
+    """Returns `nt` tap records at fixed random points with random conserved variables."""
+    rng = np.random.default_rng(seed)
+    records = np.zeros(nt, dtype=tap_dtype(npts, 5))
+    records['nq'], records['npts'], records['time'] = 5, npts, t0 + np.arange(nt)*dt
+    records['xyz'] = np.random.default_rng(1234).random((npts, 3))
+    records['q'] = rng.random((nt, npts, 5)) + 1
+    return records
+
+@pytest.fixture
+def tap_records():
+    return _tap_records
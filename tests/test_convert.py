@@ -0,0 +1,131 @@
+import multiprocessing
+import os
+
+import numpy as np
+import pytest
+
+import pyPERSA.convert as cv
+from pyPERSA.facet_reader import write_facet
+from pyPERSA.read_taps import tap_dtype
+from pyPERSA.write_loading import read_loading_header
+
+ref = {'gamma': 1.4, 'pinf': 1/1.4}
+
+def write_mixed_facet(facetfile, n=4):
+    """n x n grid of nodes, its first row of cells split into triangles and the rest quads."""
+    i, j = np.meshgrid(np.arange(n), np.arange(n), indexing='ij')
+    coordinates = np.c_[i.ravel(), j.ravel(), np.zeros(n*n)].astype(float)
+    node = lambda i, j: i*n + j + 1
+    tris, quads = [], []
+    for a in range(n - 1):
+        for b in range(n - 1):
+            if a == 0:
+                tris += [(node(a, b), node(a+1, b), node(a+1, b+1)), (node(a, b), node(a+1, b+1), node(a, b+1))]
+            else:
+                quads.append((node(a, b), node(a+1, b), node(a+1, b+1), node(a, b+1)))
+    write_facet(facetfile, coordinates, np.array(tris), np.array(quads))
+    return coordinates, len(quads)
+
+def write_constant_taps(taps_file, xyz, nt=8, dt=0.1):
+    records = np.zeros(nt, dtype=tap_dtype(xyz.shape[0], 5))
+    records['nq'], records['npts'], records['time'] = 5, xyz.shape[0], np.arange(nt)*dt
+    records['xyz'] = xyz
+    records['q'][..., 0] = 1
+    records['q'][..., 4] = 1/(1.4*0.4)
+    records.tofile(taps_file)
+
+@pytest.fixture
+def geometry_faces(monkeypatch):
+    """Replaces pywopwop by recording the number of faces each geometry file is given."""
+    written = {}
+    def write_geometry(name, xyz, normals, quad_connectivity, geometry_output_file):
+        written[name] = 0 if quad_connectivity is None else quad_connectivity.shape[0]
+    monkeypatch.setattr(cv, "write_geometry", write_geometry)
+    return written
+
+def test_mixed_facet_face_counts_agree(tmp_path, geometry_faces):
+    xyz, nquads = write_mixed_facet(str(tmp_path/"s.facet"))
+    write_constant_taps(str(tmp_path/"tap.bin"), xyz)
+    output_dir = str(tmp_path/"out")
+
+    files = cv.convert_surface('s', str(tmp_path/"s.facet"), str(tmp_path/"tap.bin"), output_dir=output_dir, ref=ref)
+    assert read_loading_header(files[1])["nfaces"] == geometry_faces['s'] == nquads
+
+    write_constant_taps(str(tmp_path/"split.bin"), np.concatenate((xyz, xyz)))
+    files = cv.convert_split_surfaces(['a', 'b'], [str(tmp_path/"s.facet")]*2, str(tmp_path/"split.bin"),
+                                      output_dir=output_dir, ref=ref)
+    for name, (geometry_file, loading_file) in zip(['a', 'b'], files):
+        assert read_loading_header(loading_file)["nfaces"] == geometry_faces[name] == nquads
+
+    cv.convert_surface_periodic('p', str(tmp_path/"s.facet"), str(tmp_path/"tap.bin"), output_dir=output_dir,
+                                ref=ref, period=0.2)
+    assert read_loading_header(str(tmp_path/"out"/"p"/"Loading.dat"))["nfaces"] == geometry_faces['p'] == nquads
+
+def _convert_or_die(name, facetfile, tapfile, **kwargs):
+    if name == 'killed':
+        os._exit(9)
+    return name, facetfile
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != 'fork', reason="workers must inherit the patched converter")
+def test_convert_case_survives_dead_worker(monkeypatch):
+    monkeypatch.setattr(cv, "convert_surface", _convert_or_die)
+    surfaces = [(name, 'f', 't') for name in ('a', 'killed', 'b', 'c')]
+    results = cv.convert_case(surfaces, nprocs=2, ref=ref)
+    assert [result["name"] for result in results] == ['a', 'killed', 'b', 'c']
+    assert [result["error"] is None for result in results] == [True, False, True, True]
+    assert results[0]["files"] == ('a', 'f')
+
+def test_periodic_node_count_mismatch(tmp_path, geometry_faces):
+    xyz, nquads = write_mixed_facet(str(tmp_path/"s.facet"))
+    write_constant_taps(str(tmp_path/"tap.bin"), xyz[:-1])
+    with pytest.raises(ValueError, match="nodes"):
+        cv.convert_surface_periodic('p', str(tmp_path/"s.facet"), str(tmp_path/"tap.bin"),
+                                    output_dir=str(tmp_path/"out"), ref=ref, period=0.2)
+    assert not os.path.exists(tmp_path/"out"/"p"/"Loading.dat") and 'p' not in geometry_faces
+
+def loading_data(loading_file):
+    with open(loading_file, 'rb') as f:
+        return f.read()
+
+def test_incremental_conversion_matches_one_shot(tmp_path, geometry_faces, tap_records):
+    facetfile = str(tmp_path/"s.facet")
+    xyz, nquads = write_mixed_facet(facetfile)
+    records = tap_records(30, npts=xyz.shape[0])
+    taps_file, full_file = str(tmp_path/"tap.bin"), str(tmp_path/"full.bin")
+    records.tofile(full_file)
+    convert = lambda tapfile, output_dir, **kwargs: cv.convert_surface(
+        's', facetfile, tapfile, output_dir=str(tmp_path/output_dir), ref=ref, chunk_size=4, **kwargs)[1]
+
+    records[:12].tofile(taps_file)
+    convert(taps_file, "inc", incremental=True)
+    # Helios appends records, the last one still being written
+    with open(taps_file, 'ab') as f:
+        records[12:20].tofile(f)
+        f.write(records[20:21].tobytes()[:100])
+    loading_file = convert(taps_file, "inc", incremental=True)
+    records[:20].tofile(str(tmp_path/"part.bin"))
+    assert loading_data(loading_file) == loading_data(convert(str(tmp_path/"part.bin"), "part"))
+    assert read_loading_header(loading_file)["nt"] == 19
+
+    # the truncated record is picked up once it is complete
+    records[:30].tofile(taps_file)
+    loading_file = convert(taps_file, "inc", incremental=True)
+    assert loading_data(loading_file) == loading_data(convert(full_file, "full"))
+    assert read_loading_header(loading_file)["nt"] == 29
+
+def test_incremental_conversion_of_rewritten_taps(tmp_path, geometry_faces, tap_records, caplog):
+    facetfile = str(tmp_path/"s.facet")
+    xyz, nquads = write_mixed_facet(facetfile)
+    taps_file = str(tmp_path/"tap.bin")
+    tap_records(10, npts=xyz.shape[0]).tofile(taps_file)
+    cv.convert_surface('s', facetfile, taps_file, output_dir=str(tmp_path/"inc"), ref=ref, incremental=True)
+
+    # a new run rewrites the tap file with other times
+    rewritten = tap_records(15, npts=xyz.shape[0], t0=5.0, seed=1)
+    rewritten.tofile(taps_file)
+    loading_file = cv.convert_surface('s', facetfile, taps_file, output_dir=str(tmp_path/"inc"), ref=ref,
+                                      incremental=True)[1]
+    assert "rewritten" in caplog.text
+    rewritten.tofile(str(tmp_path/"new.bin"))
+    expected = cv.convert_surface('s', facetfile, str(tmp_path/"new.bin"), output_dir=str(tmp_path/"new"), ref=ref)[1]
+    assert loading_data(loading_file) == loading_data(expected)
@@ -0,0 +1,25 @@
+import os
+
+import numpy as np
+
+import pyPERSA.facet_reader as fr
+
+def test_facet_cache_is_optional(tmp_path, monkeypatch):
+    coordinates = np.random.default_rng(0).random((4, 3))
+    quads = np.array([[1, 2, 3, 4]])
+    facetfile = str(tmp_path/"s.facet")
+    fr.write_facet(facetfile, coordinates, None, quads)
+
+    def read_only(file, *args, **kwargs):
+        raise PermissionError(13, "Permission denied", file)
+    monkeypatch.setattr(fr.np, "savez", read_only)
+    xyz, tri, quad = fr.read_facet(facetfile, use_cache=True)
+    np.testing.assert_allclose(xyz, coordinates)
+    np.testing.assert_array_equal(quad, quads)
+    assert tri is None and os.listdir(tmp_path) == ["s.facet"]
+
+    monkeypatch.undo()
+    fr.read_facet(facetfile, use_cache=True)
+    cached = fr.read_facet(facetfile, use_cache=True)
+    np.testing.assert_array_equal(cached[0], xyz)
+    assert os.path.isfile(facetfile + ".npz")
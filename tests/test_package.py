@@ -0,0 +1,9 @@
+import pkgutil
+
+import pyPERSA
+
+def test_every_submodule_loads_lazily():
+    submodules = {m.name for m in pkgutil.iter_modules(pyPERSA.__path__)}
+    assert submodules == pyPERSA._submodules
+    for name in submodules | set(pyPERSA._exports):
+        assert getattr(pyPERSA, name) is not None
@@ -0,0 +1,23 @@
+import numpy as np
+
+from pyPERSA.periodic import estimate_period, extract_period, period_steps
+
+def periodic_signal(nt=300, period=100, npts=8, seed=0):
+    """Blade-passage-like pressure at `npts` points with an exact integer period in steps."""
+    rng = np.random.default_rng(seed)
+    phase = 2*np.pi*np.arange(nt)[:, None]/period + rng.random(npts)*2*np.pi
+    return np.exp(np.cos(phase)) + 0.3*np.sin(3*phase)
+
+def test_estimate_period_integer_steps():
+    dt = 1e-4
+    t = np.arange(300)*dt
+    period = estimate_period(t, periodic_signal())
+    assert period_steps(t, period) == 100
+    assert abs(period/dt - 100) < 0.5
+
+def test_extract_period():
+    t = np.arange(300)*0.5
+    data = periodic_signal()
+    tkey, key = extract_period(t, data, 50.0)
+    assert tkey.shape == (100,) and tkey[0] == 0 and tkey[-1] == 49.5
+    np.testing.assert_array_equal(key, data[-100:])
@@ -0,0 +1,19 @@
+import pyPERSA.read_taps as tp
+
+def test_validated_records_stay_within_the_map(tmp_path, monkeypatch, tap_records):
+    taps_file = str(tmp_path/"tap.bin")
+    tap_records(11).tofile(taps_file)
+    memmap_taps = tp.memmap_taps
+    def memmap_then_grow(taps_file, *args, **kwargs):
+        records = memmap_taps(taps_file, *args, **kwargs)
+        with open(taps_file, 'ab') as f:
+            tap_records(2, t0=1.1).tofile(f)
+        return records
+    monkeypatch.setattr(tp, "memmap_taps", memmap_then_grow)
+
+    with tp.TapFile(taps_file, validate=True) as taps:
+        assert taps.tap_index().nvalid == 13
+        assert taps.nt == 11
+        assert taps.window() == (0, 11)
+        assert taps.time_range() == (0, 11)
+        assert taps.records().shape == (11,)
@@ -0,0 +1,24 @@
+import numpy as np
+
+from pyPERSA.resample import Decimator, UniformResampler
+
+def stream(resampler, t, data, chunk_size):
+    blocks = [resampler.process(t[i:i+chunk_size], data[i:i+chunk_size]) for i in range(0, t.size, chunk_size)]
+    blocks.append(resampler.flush())
+    return (np.concatenate([b[0] for b in blocks]),
+            np.concatenate([b[1] for b in blocks if b[1] is not None]))
+
+def series(nt, npts, seed):
+    rng = np.random.default_rng(seed)
+    t = np.cumsum(rng.uniform(0.5, 1.5, nt))
+    return t, rng.random((nt, 5, npts))
+
+def test_resampler_reused_after_flush():
+    for make in (lambda: UniformResampler(0.7), lambda: Decimator(3)):
+        reused = make()
+        for nt, npts, seed in ((40, 7, 0), (55, 11, 1)):
+            t, data = series(nt, npts, seed)
+            expected = stream(make(), t, data, 8)
+            result = stream(reused, t, data, 13)
+            np.testing.assert_allclose(result[0], expected[0])
+            np.testing.assert_allclose(result[1], expected[1])
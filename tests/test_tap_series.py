@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from pyPERSA.tap_series import TapSeries, kept_records, open_taps
+
+def test_kept_records():
+    times = np.array([0, 1, 2, 3, 2, 3, 4, 5.0])
+    np.testing.assert_array_equal(kept_records(times, keep='last'), [1, 1, 0, 0, 1, 1, 1, 1])
+    np.testing.assert_array_equal(kept_records(times, keep='first'), [1, 1, 1, 1, 0, 0, 1, 1])
+    jittered = times + np.array([0, 0, 0, 0, 1e-7, -1e-7, 0, 0])
+    np.testing.assert_array_equal(kept_records(jittered, keep='last', tol=1e-6), kept_records(times, keep='last'))
+    np.testing.assert_array_equal(kept_records(jittered, keep='first', tol=1e-6), kept_records(times, keep='first'))
+    with pytest.raises(ValueError):
+        kept_records(times, keep='middle')
+
+@pytest.fixture
+def restart(tmp_path, tap_records):
+    """A run of 20 records restarted at t=1.5 for 15 more, with the tap file of each."""
+    first, second = tap_records(20, t0=0.0, seed=0), tap_records(15, t0=1.5, seed=1)
+    # restart times differ from the first run's by rounding only
+    second['time'] += 1e-12
+    first.tofile(str(tmp_path/"run1.bin"))
+    second.tofile(str(tmp_path/"run2.bin"))
+    return [str(tmp_path/"run2.bin"), str(tmp_path/"run1.bin")], first, second
+
+@pytest.mark.parametrize("keep", ['last', 'first'])
+def test_restarted_series(restart, keep):
+    files, first, second = restart
+    if keep == 'last':
+        expected = np.concatenate((first[:15], second))
+    else:
+        expected = np.concatenate((first, second[5:]))
+
+    with open_taps(files, keep=keep, tol=1e-9) as series:
+        assert isinstance(series, TapSeries)
+        assert series.nt == 30 and series.dropped == 5
+        np.testing.assert_array_equal(series.times, expected['time'])
+        assert np.all(np.diff(series.times) > 0)
+        np.testing.assert_array_equal(series.records()['q'], expected['q'])
+
+        # blocks of 7 records, one of them across the restart
+        blocks = list(series.iter_chunks(chunk_size=7, itstart=3, points=[0, 2, 5]))
+        assert [t.shape[0] for t, q in blocks] == [7, 7, 7, 6]
+        np.testing.assert_array_equal(np.concatenate([t for t, q in blocks]), expected['time'][3:])
+        np.testing.assert_array_equal(np.concatenate([q for t, q in blocks]), expected['q'][3:, [0, 2, 5]])
+
+        itstart, ntime = series.time_range(1.0, 2.0)
+        np.testing.assert_array_equal(series.records(itstart, ntime)['time'],
+                                      expected['time'][(expected['time'] >= 1.0) & (expected['time'] <= 2.0)])
+
+def test_duplicate_times_within_tolerance(restart):
+    files, first, second = restart
+    with TapSeries(files, tol=0.0) as series:
+        # the record at the restart time differs by 1e-12 and is kept twice
+        assert series.nt == 31
+        assert series.times[16] - series.times[15] < 1e-11
+    with TapSeries(files, tol=1e-9) as series:
+        assert series.nt == 30
+    with TapSeries(files, tol=0.05) as series:
+        # records of the first run 0.1 apart from the restart are not duplicates
+        assert series.nt == 30
+        np.testing.assert_array_equal(series.times[:15], first['time'][:15])
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from pyPERSA.read_taps import TapFile
+from pyPERSA.tap_store import TapStore, convert_to_store
+
+fields = ("Density", "XMomentum", "Pressure")
+ref = {'gamma': 1.4, 'pinf': 1/1.4}
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_store_round_trip_with_append(tmp_path, tap_records, compress):
+    records = tap_records(33, npts=6)
+    taps_file, store_dir = str(tmp_path/"tap.bin"), str(tmp_path/"store")
+    records[:20].tofile(taps_file)
+    with TapFile(taps_file, fields=fields, ref=ref, validate=True) as taps:
+        store = convert_to_store(taps, store_dir, chunk_size=6, compress=compress)
+    assert store.nt == 20
+
+    # Helios wrote more records since
+    with open(taps_file, 'ab') as f:
+        records[20:].tofile(f)
+    with TapFile(taps_file, fields=fields, ref=ref, validate=True) as taps:
+        store = convert_to_store(taps, store_dir, chunk_size=6, compress=not compress, append=True)
+        expected = taps.load_fields(itstart=4, ntime=25, points=[1, 3, 4])
+        everything = taps.load_fields()
+
+    store = TapStore(store_dir)
+    assert store.nt == 33 and store.manifest["compress"] == compress
+    np.testing.assert_array_equal(store.times(), records['time'])
+    np.testing.assert_array_equal(store.xyz(), records['xyz'][0])
+    for itstart, ntime, points, reference in ((4, 25, [1, 3, 4], expected), (0, -1, None, everything)):
+        v = store.load_fields(itstart=itstart, ntime=ntime, points=points)
+        np.testing.assert_array_equal(v["T"], reference["T"])
+        for field in fields:
+            np.testing.assert_array_equal(v[field], reference[field])
+
+def test_compressed_and_uncompressed_stores_agree(tmp_path, tap_records):
+    tap_records(25, npts=5).tofile(str(tmp_path/"tap.bin"))
+    with TapFile(str(tmp_path/"tap.bin"), fields=fields, ref=ref, validate=True) as taps:
+        plain = convert_to_store(taps, str(tmp_path/"plain"), chunk_size=4)
+        packed = convert_to_store(taps, str(tmp_path/"packed"), chunk_size=4, compress=True)
+    for itstart, ntime in ((0, -1), (3, 9), (7, 1), (24, 5), (25, 3)):
+        for field in fields:
+            np.testing.assert_array_equal(packed.read(field, itstart, ntime, points=[0, 4]),
+                                          plain.read(field, itstart, ntime, points=[0, 4]))